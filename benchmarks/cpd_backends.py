@@ -0,0 +1,83 @@
+"""
+Benchmark of the change point detection backends in utils.cpd.
+
+Runs every backend at a few penalties on a BTC-like series (a geometric
+random walk with regime changes, ~5,500 daily points by default, or a CSV
+with a price column) and reports runtime, number of breakpoints and the
+agreement with a reference backend (Hausdorff distance and F1 within a
+margin, from ruptures.metrics).
+
+Usage:
+    python benchmarks/cpd_backends.py
+    python benchmarks/cpd_backends.py --csv btc.csv --column BTC_PRICE_USD --reference rbf
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from ruptures.metrics import hausdorff, precision_recall
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cpd import CPD_BACKENDS, segmenter  # noqa: E402
+
+
+def synthetic_price(n, seed=0):
+    """Geometric random walk whose drift and volatility switch every few hundred days."""
+    rng = np.random.default_rng(seed)
+    regimes = np.sort(rng.choice(np.arange(200, n - 200), size=max(1, n // 600), replace=False))
+    drift = np.zeros(n)
+    vol = np.zeros(n)
+    for start, end in zip(np.r_[0, regimes], np.r_[regimes, n]):
+        drift[start:end] = rng.normal(0, 0.004)
+        vol[start:end] = rng.uniform(0.01, 0.05)
+    return 100 * np.exp(np.cumsum(drift + vol * rng.normal(size=n)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", help="CSV file holding a price column")
+    parser.add_argument("--column", default="BTC_PRICE_USD")
+    parser.add_argument("--points", type=int, default=5500, help="length of the synthetic series")
+    parser.add_argument("--penalties", type=float, nargs="+", default=[5, 10, 50, 100])
+    parser.add_argument("--reference", default="l2", choices=list(CPD_BACKENDS))
+    parser.add_argument("--backends", nargs="+", default=[b for b in CPD_BACKENDS if b != "rbf"],
+                        choices=list(CPD_BACKENDS), help="rbf is excluded by default (slow)")
+    parser.add_argument("--margin", type=int, default=10, help="F1 margin in samples")
+    args = parser.parse_args()
+
+    if args.csv:
+        signal = pd.read_csv(args.csv)[args.column].dropna().to_numpy(dtype=float)
+    else:
+        signal = synthetic_price(args.points)
+    n = len(signal)
+    print(f"Series length: {n}\n")
+
+    backends = list(dict.fromkeys([args.reference] + args.backends))
+    rows = []
+    for pen in args.penalties:
+        reference_bkps = None
+        for backend in backends:
+            segment, _ = segmenter(signal, backend)
+            start = time.perf_counter()
+            bkps = segment(pen)
+            elapsed = time.perf_counter() - start
+            if backend == args.reference:
+                reference_bkps = bkps
+
+            row = {"penalty": pen, "backend": backend, "seconds": round(elapsed, 4), "n_changes": len(bkps) - 1}
+            if len(bkps) > 1 and len(reference_bkps) > 1:
+                precision, recall = precision_recall(reference_bkps, bkps, margin=args.margin)
+                f1 = 0.0 if precision + recall == 0 else 2 * precision * recall / (precision + recall)
+                row["hausdorff"] = hausdorff(reference_bkps, bkps)
+                row["f1_vs_ref"] = round(f1, 3)
+            rows.append(row)
+
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
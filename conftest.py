@@ -0,0 +1,2 @@
+# Root conftest: its presence puts the repository root on sys.path, so the
+# tests import `utils` the same way the pages do.
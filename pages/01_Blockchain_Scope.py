@@ -2,6 +2,11 @@ import streamlit as st
 import pandas as pd
 import json
 
+from utils.block_explorer import (
+    FACT_BLOCKS, JSON_PAGE_SIZE, TX_PAGE_SIZE, get_block_cache, next_page_cursor
+)
+from utils.query import run, sql
+
 st.set_page_config(
     page_title="Bitcoin Block Explorer",
     layout="wide",
@@ -13,6 +18,11 @@ st.title("Bitcoin Block Explorer")
 # Snowflake connection
 cx = st.connection("snowflake")
 session = cx.session()
+block_cache = get_block_cache(session)
+
+# Keyset cursors of the pages visited so far in the block being shown: {block: [None, after page 1, ...]}
+if "tx_page_cursors" not in st.session_state:
+    st.session_state["tx_page_cursors"] = {}
 
 # Search bar
 st.write("**Search by block number, block hash, or TX_ID.**")
@@ -27,37 +37,29 @@ def show_transaction_details(tx_id):
     Display a "detailed" layout for the transaction from FACT_TRANSACTIONS,
     including:
       - Fees in BTC and sats
-      - 'INPUTS' and 'OUTPUTS' columns if present (parsed as JSON)
+      - 'INPUTS' and 'OUTPUTS' columns if present (flattened in pages, or raw JSON)
       - Optional queries to FACT_INPUTS and FACT_OUTPUTS for cross-check
       - Toggle between "Overview" or "Raw JSON" for each section
     """
     st.subheader(f"Transaction details for TX_ID: {tx_id}")
 
-    # 1) Basic transaction info from FACT_TRANSACTIONS (including JSON columns if available)
-    tx_info_query = f"""
-        SELECT
-            BLOCK_NUMBER,
-            BLOCK_TIMESTAMP,
-            BLOCK_HASH,
-            TX_ID,
-            TX_HASH,
-            FEE,            -- Fee in BTC
-            IS_COINBASE,
-            INPUT_COUNT,
-            OUTPUT_COUNT,
-            INPUT_VALUE,
-            OUTPUT_VALUE,
-            SIZE,
-            WEIGHT,
-            VERSION,
-            LOCK_TIME,
-            INPUTS,         -- JSON column if it exists in your table
-            OUTPUTS         -- JSON column if it exists in your table
-        FROM BITCOIN_ONCHAIN_CORE_DATA.CORE.FACT_TRANSACTIONS
-        WHERE TX_ID = '{tx_id}'
-        LIMIT 1
-    """
-    tx_info_df = session.sql(tx_info_query).to_pandas()
+    # The FACT_TRANSACTIONS, FACT_INPUTS and FACT_OUTPUTS lookups run
+    # concurrently; each section is drawn into its placeholder as soon as
+    # its own result arrives, whatever the completion order.
+    sections = {
+        "transaction": (st.container(), render_transaction_info),
+        "inputs": (st.container(), render_fact_inputs),
+        "outputs": (st.container(), render_fact_outputs),
+    }
+    for name, frame in block_cache.transaction_details(tx_id):
+        placeholder, render = sections[name]
+        with placeholder:
+            render(frame)
+
+
+def render_transaction_info(tx_info_df):
+    """Summary and INPUTS / OUTPUTS JSON sections of a FACT_TRANSACTIONS row."""
+    # 1) Basic transaction info from FACT_TRANSACTIONS
     if tx_info_df.empty:
         st.warning("Transaction not found in FACT_TRANSACTIONS.")
         return
@@ -98,43 +100,7 @@ def show_transaction_details(tx_id):
     # 1) INPUTS from JSON column
     ############################
     st.markdown("### Inputs (from FACT_TRANSACTIONS.INPUTS column)")
-
-    inputs_raw = row.get("INPUTS")  # This might be a JSON string or None
-    if inputs_raw:
-        try:
-            parsed_inputs = json.loads(inputs_raw)
-            if not isinstance(parsed_inputs, list):
-                st.info("INPUTS JSON is not a list. Showing raw JSON:")
-                st.json(parsed_inputs)
-            else:
-                # Let user pick "Overview" or "Raw JSON"
-                inputs_view_mode = st.selectbox("Inputs View Mode", ["Overview", "Raw JSON"], key="inputs_view")
-                if inputs_view_mode == "Overview":
-                    # Build a small table of relevant fields
-                    overview_data = []
-                    for inp in parsed_inputs:
-                        txid = inp.get("txid", "")
-                        vout = inp.get("vout", "")
-                        asm = inp.get("scriptSig", {}).get("asm", "")
-                        seq = inp.get("sequence", "")
-                        witness = inp.get("txinwitness", [])
-                        overview_data.append({
-                            "TXID": txid,
-                            "Vout": vout,
-                            "ASM": asm,
-                            "Sequence": seq,
-                            "Witness Count": len(witness)
-                        })
-                    overview_df = pd.DataFrame(overview_data)
-                    st.dataframe(overview_df, use_container_width=True)
-                else:
-                    # Raw JSON
-                    st.json(parsed_inputs)
-        except json.JSONDecodeError:
-            st.error("Error parsing INPUTS JSON. Showing raw text:")
-            st.text(inputs_raw)
-    else:
-        st.info("No 'INPUTS' JSON found in this transaction record (FACT_TRANSACTIONS).")
+    render_json_column(row["TX_ID"], "INPUTS", "inputs")
 
     st.write("---")
 
@@ -142,63 +108,55 @@ def show_transaction_details(tx_id):
     # 2) OUTPUTS from JSON column
     #############################
     st.markdown("### Outputs (from FACT_TRANSACTIONS.OUTPUTS column)")
-    outputs_raw = row.get("OUTPUTS")  # Also a JSON string or None
-    if outputs_raw:
+    render_json_column(row["TX_ID"], "OUTPUTS", "outputs")
+
+    st.write("---")
+
+
+def render_json_column(tx_id, column, key):
+    """
+    Overview of a JSON column, flattened server-side one page at a time,
+    or the raw JSON, which is only fetched when "Raw JSON" is picked.
+    """
+    view_mode = st.selectbox(f"{column.title()} View Mode", ["Overview", "Raw JSON"], key=f"{key}_view")
+    if view_mode == "Overview":
+        # Pages are sized from the array itself, not from INPUT_COUNT / OUTPUT_COUNT
+        count = block_cache.json_length(tx_id, column)
+        if count is None:
+            st.info(f"No '{column}' JSON array found in this transaction record (FACT_TRANSACTIONS).")
+            return
+        if count == 0:
+            st.info(f"The '{column}' JSON array of this transaction is empty.")
+            return
+        page_count = (count + JSON_PAGE_SIZE - 1) // JSON_PAGE_SIZE
+        page = 1
+        if page_count > 1:
+            page = st.number_input(
+                f"{column.title()} page (of {page_count}, {JSON_PAGE_SIZE} per page)",
+                min_value=1, max_value=page_count, value=1, key=f"{key}_page"
+            )
+        overview_df = block_cache.json_overview(tx_id, column, page - 1)
+        if overview_df.empty:
+            st.warning(f"Page {page} of the '{column}' JSON array returned no elements.")
+        else:
+            st.dataframe(overview_df, use_container_width=True)
+    else:
+        raw = block_cache.transaction_json(tx_id, column)  # JSON string or None
+        if not raw:
+            st.info(f"No '{column}' JSON found in this transaction record (FACT_TRANSACTIONS).")
+            return
         try:
-            parsed_outputs = json.loads(outputs_raw)
-            if not isinstance(parsed_outputs, list):
-                st.info("OUTPUTS JSON is not a list. Showing raw JSON:")
-                st.json(parsed_outputs)
-            else:
-                outputs_view_mode = st.selectbox("Outputs View Mode", ["Overview", "Raw JSON"], key="outputs_view")
-                if outputs_view_mode == "Overview":
-                    out_data = []
-                    for out in parsed_outputs:
-                        n = out.get("n", "")
-                        val = out.get("value", "")
-                        spk = out.get("scriptPubKey", {})
-                        spk_type = spk.get("type", "")
-                        spk_addr = spk.get("address", "")
-                        out_data.append({
-                            "Index (n)": n,
-                            "Value (BTC)": val,
-                            "ScriptPubKey Type": spk_type,
-                            "Address": spk_addr
-                        })
-                    out_df = pd.DataFrame(out_data)
-                    st.dataframe(out_df, use_container_width=True)
-                else:
-                    st.json(parsed_outputs)
+            st.json(json.loads(raw))
         except json.JSONDecodeError:
-            st.error("Error parsing OUTPUTS JSON. Showing raw text:")
-            st.text(outputs_raw)
-    else:
-        st.info("No 'OUTPUTS' JSON found in this transaction record (FACT_TRANSACTIONS).")
+            st.error(f"Error parsing {column} JSON. Showing raw text:")
+            st.text(raw)
 
-    st.write("---")
 
-    #################################
-    # 3) Additional: FACT_INPUTS / FACT_OUTPUTS if you want cross-check
-    #################################
+#################################
+# 3) Additional: FACT_INPUTS / FACT_OUTPUTS if you want cross-check
+#################################
+def render_fact_inputs(inputs_df):
     st.markdown("### Transaction Inputs (FACT_INPUTS table)")
-    inputs_query = f"""
-        SELECT
-            BLOCK_TIMESTAMP,
-            BLOCK_NUMBER,
-            BLOCK_HASH,
-            TX_ID,
-            INDEX,
-            IS_COINBASE,
-            SPENT_TX_ID,
-            SPENT_OUTPUT_INDEX,
-            VALUE,
-            VALUE_SATS,
-            INPUT_ID
-        FROM BITCOIN_ONCHAIN_CORE_DATA.CORE.FACT_INPUTS
-        WHERE TX_ID = '{tx_id}'
-        LIMIT 50
-    """
-    inputs_df = session.sql(inputs_query).to_pandas()
     if inputs_df.empty:
         st.info("No records found in FACT_INPUTS for this TX.")
     else:
@@ -211,22 +169,9 @@ def show_transaction_details(tx_id):
         else:
             st.json(inputs_df.to_dict(orient="records"))
 
+
+def render_fact_outputs(outputs_df):
     st.markdown("### Transaction Outputs (FACT_OUTPUTS table)")
-    outputs_query = f"""
-        SELECT
-            BLOCK_TIMESTAMP,
-            BLOCK_NUMBER,
-            BLOCK_HASH,
-            TX_ID,
-            INDEX,
-            VALUE,
-            VALUE_SATS,
-            OUTPUT_ID
-        FROM BITCOIN_ONCHAIN_CORE_DATA.CORE.FACT_OUTPUTS
-        WHERE TX_ID = '{tx_id}'
-        LIMIT 50
-    """
-    outputs_df = session.sql(outputs_query).to_pandas()
     if outputs_df.empty:
         st.info("No records found in FACT_OUTPUTS for this TX.")
     else:
@@ -251,22 +196,8 @@ def show_block_details(block_number):
     """
     st.subheader(f"Block #{block_number} Details")
 
-    # Query block info from FACT_BLOCKS
-    query_block = f"""
-        SELECT 
-            BLOCK_NUMBER,
-            BLOCK_HASH,
-            BLOCK_TIMESTAMP,
-            SIZE,
-            TX_COUNT,
-            VERSION,
-            INSERTED_TIMESTAMP,
-            MODIFIED_TIMESTAMP
-        FROM BITCOIN_ONCHAIN_CORE_DATA.CORE.FACT_BLOCKS
-        WHERE BLOCK_NUMBER = '{block_number}'
-        LIMIT 1
-    """
-    block_df = session.sql(query_block).to_pandas()
+    # Block info from FACT_BLOCKS (cached once confirmed)
+    block_df = block_cache.block(block_number)
     if block_df.empty:
         st.warning("Block not found in FACT_BLOCKS.")
         return
@@ -294,23 +225,28 @@ def show_block_details(block_number):
     if view_mode_block == "Raw JSON":
         st.json(block_df.to_dict(orient="records"))
 
-    st.markdown("### Transactions in this block (up to 100)")
-
-    # Query transactions in this block
-    tx_query = f"""
-        SELECT 
-            TX_ID,
-            INPUT_COUNT,
-            OUTPUT_COUNT,
-            OUTPUT_VALUE_SATS,
-            FEE,
-            IS_COINBASE
-        FROM BITCOIN_ONCHAIN_CORE_DATA.CORE.FACT_TRANSACTIONS
-        WHERE BLOCK_NUMBER = '{block_number}'
-        ORDER BY IS_COINBASE DESC, TX_ID
-        LIMIT 100
-    """
-    tx_df = session.sql(tx_query).to_pandas()
+    st.markdown("### Transactions in this block")
+
+    # One keyset page of transactions (cached once confirmed, next page prefetched)
+    # Only the block being shown keeps its cursors; switching blocks starts over at page 1
+    page_cursors = st.session_state["tx_page_cursors"]
+    if int(block_number) not in page_cursors:
+        page_cursors.clear()
+    cursors = page_cursors.setdefault(int(block_number), [None])
+    tx_df = block_cache.transaction_page(block_number, cursors[-1])
+    next_cursor = next_page_cursor(tx_df)
+
+    tx_count = block_row["TX_COUNT"]
+    page_count = max((int(tx_count) + TX_PAGE_SIZE - 1) // TX_PAGE_SIZE, 1) if pd.notna(tx_count) else "?"
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    prev_col.button(
+        "Previous page", key="tx_prev_page", disabled=len(cursors) == 1, on_click=cursors.pop
+    )
+    page_col.write(f"Page {len(cursors)} of {page_count} ({TX_PAGE_SIZE} transactions per page)")
+    next_col.button(
+        "Next page", key="tx_next_page", disabled=next_cursor is None,
+        on_click=cursors.append, args=(next_cursor,)
+    )
 
     if tx_df.empty:
         st.info("No transactions found in this block.")
@@ -334,18 +270,18 @@ def show_block_details(block_number):
 if not search_input:
     # Show latest 10 blocks if no search input
     st.subheader("Latest Blocks")
-    latest_blocks_query = """
+    latest_blocks_query = sql(f"""
         SELECT 
             BLOCK_NUMBER,
             BLOCK_HASH,
             BLOCK_TIMESTAMP,
             SIZE,
             TX_COUNT
-        FROM BITCOIN_ONCHAIN_CORE_DATA.CORE.FACT_BLOCKS
+        FROM {FACT_BLOCKS}
         ORDER BY BLOCK_NUMBER DESC
         LIMIT 10
-    """
-    df_blocks = session.sql(latest_blocks_query).to_pandas()
+    """)
+    df_blocks = run(session, latest_blocks_query)
     st.dataframe(df_blocks, use_container_width=True)
 
     if not df_blocks.empty:
@@ -355,64 +291,22 @@ if not search_input:
             show_block_details(selected_block)
 
 else:
-    # If we have search input => interpret block_number vs block_hash vs TX_ID
-    if search_input.isdigit():
-        # Possibly a block_number
-        query_block = f"""
-            SELECT 
-                BLOCK_NUMBER,
-                BLOCK_HASH,
-                BLOCK_TIMESTAMP,
-                SIZE,
-                TX_COUNT
-            FROM BITCOIN_ONCHAIN_CORE_DATA.CORE.FACT_BLOCKS
-            WHERE BLOCK_NUMBER = {int(search_input)}
-            LIMIT 1
-        """
-        result = session.sql(query_block).to_pandas()
-        if not result.empty:
-            st.success(f"Found block #{search_input}")
-            st.dataframe(result)
-            show_block_details(int(search_input))
-        else:
-            st.error(f"No block found for block_number = {search_input}")
+    # One round trip classifies the input as block number, block hash or
+    # TX_ID and returns the matching row (which also seeds the detail views)
+    match_type, match = block_cache.resolve(search_input.strip())
+    if match_type == "block_number":
+        st.success(f"Found block #{search_input}")
+        st.dataframe(match[["BLOCK_NUMBER", "BLOCK_HASH", "BLOCK_TIMESTAMP", "SIZE", "TX_COUNT"]])
+        show_block_details(match["BLOCK_NUMBER"].iloc[0])
+    elif match_type == "block_hash":
+        st.success(f"Found block with hash = {search_input}")
+        st.dataframe(match[["BLOCK_NUMBER", "BLOCK_HASH", "BLOCK_TIMESTAMP", "SIZE", "TX_COUNT"]])
+        show_block_details(match["BLOCK_NUMBER"].iloc[0])
+    elif match_type == "tx_id":
+        st.success(f"Found transaction with TX_ID = {search_input}")
+        st.dataframe(match[["TX_ID", "BLOCK_NUMBER", "INPUT_COUNT", "OUTPUT_COUNT", "OUTPUT_VALUE_SATS", "FEE"]])
+        show_transaction_details(match["TX_ID"].iloc[0])
+    elif search_input.strip().isdigit():
+        st.error(f"No block found for block_number = {search_input}")
     else:
-        # Possibly a block hash or a TX_ID
-        block_hash_query = f"""
-            SELECT 
-                BLOCK_NUMBER,
-                BLOCK_HASH,
-                BLOCK_TIMESTAMP,
-                SIZE,
-                TX_COUNT
-            FROM BITCOIN_ONCHAIN_CORE_DATA.CORE.FACT_BLOCKS
-            WHERE BLOCK_HASH = '{search_input}'
-            LIMIT 1
-        """
-        df_block = session.sql(block_hash_query).to_pandas()
-
-        tx_id_query = f"""
-            SELECT 
-                TX_ID,
-                BLOCK_NUMBER,
-                INPUT_COUNT,
-                OUTPUT_COUNT,
-                OUTPUT_VALUE_SATS,
-                FEE
-            FROM BITCOIN_ONCHAIN_CORE_DATA.CORE.FACT_TRANSACTIONS
-            WHERE TX_ID = '{search_input}'
-            LIMIT 1
-        """
-        df_tx = session.sql(tx_id_query).to_pandas()
-
-        if not df_block.empty:
-            block_num = df_block["BLOCK_NUMBER"].iloc[0]
-            st.success(f"Found block with hash = {search_input}")
-            st.dataframe(df_block)
-            show_block_details(block_num)
-        elif not df_tx.empty:
-            st.success(f"Found transaction with TX_ID = {search_input}")
-            st.dataframe(df_tx)
-            show_transaction_details(search_input)
-        else:
-            st.error(f"No block or transaction found matching {search_input}.")
+        st.error(f"No block or transaction found matching {search_input}.")
@@ -4,11 +4,15 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import datetime
 import random
-import ruptures as rpt
 import numpy as np
 import io
 import plotly.io as pio
 
+from utils.btc_price import BTC_PRICE_VALUE_COL, load_btc_price
+from utils.cpd import CPD_BACKENDS, breakpoints_for_penalty, penalty_path_within_budget, series_hash
+from utils.metric_store import RowBudgetExceeded, get_metric_store
+from utils.normalization import normalize_per_segment
+
 ######################################
 # 1) Page Configuration & Theme Setup
 ######################################
@@ -51,6 +55,7 @@ st.markdown(css_style, unsafe_allow_html=True)
 ######################################
 cx = st.connection("snowflake")
 session = cx.session()
+store = get_metric_store(session)
 
 ######################################
 # 3) Define Color Palette & Session State
@@ -154,7 +159,9 @@ TABLE_DICT = {
     "UTXO LIFECYCLE": {
         "table_name": "BTC_DATA.DATA.UTXO_LIFECYCLE",
         "date_col": "CREATED_TIMESTAMP",
-        "numeric_cols": ["BTC_VALUE"]
+        "numeric_cols": ["BTC_VALUE", "UTXO_COUNT"],
+        # One row per UTXO: BTC created and UTXO count per day, grouped in the warehouse
+        "aggregate": {"BTC_VALUE": "SUM(BTC_VALUE)", "UTXO_COUNT": "COUNT(*)"}
     },
     "M2 GROWTH": {
         "table_name": "BTC_DATA.DATA.M2_GROWTH",
@@ -210,9 +217,8 @@ TABLE_DICT = {
     },
 }
 
-BTC_PRICE_TABLE = "BTC_DATA.DATA.BTC_PRICE_USD"
-BTC_PRICE_DATE_COL = "DATE"
-BTC_PRICE_VALUE_COL = "BTC_PRICE_USD"
+CPD_PEN_MIN = 1
+CPD_PEN_MAX = 200
 
 ######################################
 # 5) Page Title
@@ -281,7 +287,22 @@ with st.sidebar:
     detect_cpd = st.checkbox("Detect BTC Price Change Points?", value=False)
     pen_value = None
     if detect_cpd:
-        pen_value = st.number_input("CPD Penalty", min_value=1, max_value=200, value=10)
+        pen_value = st.number_input("CPD Penalty", min_value=CPD_PEN_MIN, max_value=CPD_PEN_MAX, value=10)
+        cpd_backend = st.selectbox(
+            "CPD Backend",
+            list(CPD_BACKENDS.keys()),
+            index=0,
+            format_func=CPD_BACKENDS.get,
+            help="Kernel PELT is the most flexible but its cost grows quadratically with the history length. "
+                 "Penalties are on each backend's own cost scale, so the same value gives different "
+                 "breakpoints on different backends."
+        )
+        cpd_time_budget = st.number_input(
+            "CPD Time Budget (seconds)",
+            min_value=0.5, max_value=120.0, value=5.0, step=0.5,
+            help="Best effort: if the backend runs out of time, a cheaper backend is used instead. "
+                 "A single kernel PELT run cannot be interrupted, so the budget is only checked between runs."
+        )
 
     # Normalization Options
     st.markdown("---")
@@ -336,41 +357,15 @@ plot_container = st.container()
 with plot_container:
     # --- 8.1) Special Case: FEAR & GREED INDEX ---
     if selected_table == "FEAR & GREED INDEX":
-        # 1) Query Fear & Greed data
-        date_col = table_info["date_col"]
-        cols_for_query = ", ".join(selected_cols)
-
-        # Build query for Fear & Greed
-        query_fng = f"""
-            SELECT
-                CAST({date_col} AS DATE) AS DATE,
-                {cols_for_query},
-                FNG_CLASS
-            FROM {table_info['table_name']}
-            WHERE CAST({date_col} AS DATE) >= '{selected_start_date}'
-        """
-        if selected_end_date:
-            query_fng += f" AND CAST({date_col} AS DATE) <= '{selected_end_date}'\n"
-        query_fng += "ORDER BY DATE"
-
-        df_fng = session.sql(query_fng).to_pandas()
-        df_fng.rename(columns={"DATE": "DATE"}, inplace=True)
-
-        # 2) Query BTC Price
+        # 1) Load Fear & Greed data from the local metric store
+        df_fng = store.load(
+            table_info, selected_cols + ["FNG_CLASS"], selected_start_date, selected_end_date
+        )
+
+        # 2) Slice the shared BTC Price series
         df_btc = pd.DataFrame()
         if show_btc_price:
-            btc_query = f"""
-                SELECT
-                    CAST({BTC_PRICE_DATE_COL} AS DATE) AS DATE,
-                    {BTC_PRICE_VALUE_COL}
-                FROM {BTC_PRICE_TABLE}
-                WHERE {BTC_PRICE_VALUE_COL} IS NOT NULL
-                AND CAST({BTC_PRICE_DATE_COL} AS DATE) >= '{selected_start_date}'
-            """
-            if selected_end_date:
-                btc_query += f" AND CAST({BTC_PRICE_DATE_COL} AS DATE) <= '{selected_end_date}'\n"
-            btc_query += "ORDER BY DATE"
-            df_btc = session.sql(btc_query).to_pandas()
+            df_btc = load_btc_price(session, selected_start_date, selected_end_date)
 
         # 3) Merge on DATE (outer join to capture all dates)
         merged_df = pd.merge(df_btc, df_fng, on="DATE", how="outer")
@@ -448,39 +443,16 @@ with plot_container:
     # -------------------------
     # ELSE: REGULAR INDICATORS
     # -------------------------
-    date_col = table_info["date_col"]
-    cols_for_query = ", ".join(selected_cols)
-    
-    # Build query with date range
-    query = f"""
-        SELECT
-            CAST({date_col} AS DATE) AS DATE,
-            {cols_for_query}
-        FROM {table_info['table_name']}
-        WHERE CAST({date_col} AS DATE) >= '{selected_start_date}'
-    """
-    if selected_end_date:
-        query += f" AND CAST({date_col} AS DATE) <= '{selected_end_date}'\n"
-    query += "ORDER BY DATE"
-    
-    df_indicators = session.sql(query).to_pandas()
-    df_indicators.rename(columns={"DATE": "DATE"}, inplace=True)
+    try:
+        df_indicators = store.load(table_info, selected_cols, selected_start_date, selected_end_date)
+    except RowBudgetExceeded as e:
+        st.error(str(e))
+        st.stop()
 
-    # 8.2) Query BTC Price if requested
+    # 8.2) Slice the shared BTC Price series if requested
     df_btc = pd.DataFrame()
     if show_btc_price:
-        btc_query = f"""
-            SELECT
-                CAST({BTC_PRICE_DATE_COL} AS DATE) AS DATE,
-                {BTC_PRICE_VALUE_COL}
-            FROM {BTC_PRICE_TABLE}
-            WHERE {BTC_PRICE_VALUE_COL} IS NOT NULL
-              AND CAST({BTC_PRICE_DATE_COL} AS DATE) >= '{selected_start_date}'
-        """
-        if selected_end_date:
-            btc_query += f" AND CAST({BTC_PRICE_DATE_COL} AS DATE) <= '{selected_end_date}'\n"
-        btc_query += "ORDER BY DATE"
-        df_btc = session.sql(btc_query).to_pandas()
+        df_btc = load_btc_price(session, selected_start_date, selected_end_date)
 
     # 8.3) Merge data
     if show_btc_price and not df_btc.empty:
@@ -494,68 +466,38 @@ with plot_container:
         st.stop()
 
     # 8.4) CPD on BTC Price if enabled
+    # The whole penalty path is computed once per series (keyed by its hash),
+    # so changing the penalty input is only a lookup.
+    @st.cache_data(show_spinner="Computing change points for all penalties...")
+    def cpd_penalty_path(btc_series_hash, _btc_series, backend, time_budget, pen_min, pen_max):
+        return penalty_path_within_budget(_btc_series, backend, pen_min, pen_max, time_budget)
+
     change_points = []
+    cpd_path = []
     if detect_cpd and show_btc_price and BTC_PRICE_VALUE_COL in merged_df.columns:
         btc_series = merged_df[BTC_PRICE_VALUE_COL].dropna().values
         if len(btc_series) > 2:
-            algo = rpt.Pelt(model="rbf").fit(btc_series)
-            change_points = algo.predict(pen=pen_value)
+            cpd_path, cpd_backend_used = cpd_penalty_path(
+                series_hash(btc_series), btc_series, cpd_backend, cpd_time_budget, CPD_PEN_MIN, CPD_PEN_MAX
+            )
+            change_points = breakpoints_for_penalty(cpd_path, pen_value)
+            if cpd_backend_used != cpd_backend:
+                st.info(
+                    f"'{CPD_BACKENDS[cpd_backend]}' exceeded the {cpd_time_budget:g}s budget; "
+                    f"change points come from '{CPD_BACKENDS[cpd_backend_used]}'."
+                )
         else:
             st.warning("Not enough BTC Price data for change point detection.")
 
-    # --- Helper functions for normalization ---
-    def z_score(series: pd.Series):
-        mu = series.mean()
-        sigma = series.std()
-        return (series - mu) / sigma if sigma != 0 else series
-
-    def min_max(series: pd.Series):
-        min_val = series.min()
-        max_val = series.max()
-        return (series - min_val) / (max_val - min_val) if max_val != min_val else series
-
-    def robust_scale(series: pd.Series):
-        median_val = series.median()
-        iqr = series.quantile(0.75) - series.quantile(0.25)
-        return (series - median_val) / iqr if iqr != 0 else series
-
-    def log_transform(series: pd.Series):
-        # Add small constant to avoid log(0)
-        return np.log(series + 1e-9).replace(-np.inf, np.nan)
-
-    def apply_normalization(series: pd.Series, method: str) -> pd.Series:
-        s = series.copy()
-        if method == "Z-Score":
-            s = z_score(s)
-        elif method == "Min-Max":
-            s = min_max(s)
-        elif method == "Robust":
-            s = robust_scale(s)
-        elif method == "Log Transform":
-            s = log_transform(s)
-        return s
-
     # --- 8.5) Apply Normalization ---
-    def normalize_per_segment(df: pd.DataFrame, segments: list, columns_to_normalize: dict):
-        prev_cp = 0
-        for cp in segments:
-            seg_indices = df.index[prev_cp:cp]
-            for col, method in columns_to_normalize.items():
-                if col in df.columns and method != "None":
-                    seg_data = df.loc[seg_indices, col]
-                    df.loc[seg_indices, col] = apply_normalization(seg_data, method)
-            prev_cp = cp
-
+    # One segment-id labelling and one groupby transform per method
     columns_with_methods = {
         c: col_to_norm_method[c] for c in col_to_norm_method if col_to_norm_method[c] != "None"
     }
 
-    if detect_cpd and change_points:
-        normalize_per_segment(merged_df, change_points, columns_with_methods)
-    else:
-        for col, method in columns_with_methods.items():
-            if col in merged_df.columns and method != "None":
-                merged_df[col] = apply_normalization(merged_df[col], method)
+    normalize_per_segment(
+        merged_df, change_points if detect_cpd else [], columns_with_methods
+    )
 
     # 8.6) Calculate EMA if requested
     if show_ema:
@@ -688,6 +630,31 @@ with plot_container:
     }
     st.plotly_chart(fig, use_container_width=True, config=config)
 
+    # 8.10) Number of segments across the whole penalty range
+    if cpd_path:
+        with st.expander("CPD: number of segments vs. penalty"):
+            pen_steps = [entry["pen_from"] for entry in cpd_path] + [cpd_path[-1]["pen_to"]]
+            seg_steps = [entry["n_changes"] + 1 for entry in cpd_path]
+            fig_path = go.Figure(go.Scatter(
+                x=pen_steps,
+                y=seg_steps + seg_steps[-1:],
+                mode="lines",
+                line_shape="hv",
+                name="Segments"
+            ))
+            fig_path.add_vline(x=pen_value, line_dash="dash", line_color="white")
+            fig_path.update_layout(
+                paper_bgcolor="#000000",
+                plot_bgcolor="#000000",
+                font=dict(color="#f0f2f6"),
+                xaxis_title="Penalty",
+                yaxis_title="Number of segments",
+                height=300
+            )
+            fig_path.update_xaxes(gridcolor="#4f5b66")
+            fig_path.update_yaxes(gridcolor="#4f5b66")
+            st.plotly_chart(fig_path, use_container_width=True)
+
 ######################################
 # 9) Save Figure Button
 ######################################
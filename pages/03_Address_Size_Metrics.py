@@ -6,6 +6,10 @@ import plotly.graph_objects as go
 import datetime
 import random
 
+from utils.balance_bands import (
+    COHORT_PRESETS, cohort_metrics, fetch_balance_bands, load_band_matrix, preset_cohorts
+)
+
 ######################################
 # 1) Page Configuration & Dark Theme
 ######################################
@@ -48,6 +52,10 @@ if "color_palette" not in st.session_state:
     st.session_state["color_palette"] = COLOR_PALETTE.copy()
     random.shuffle(st.session_state["color_palette"])
 
+# Custom band cohorts: name -> list of bands
+if "band_cohorts" not in st.session_state:
+    st.session_state["band_cohorts"] = {}
+
 ######################################
 # 4) Title
 ######################################
@@ -66,14 +74,8 @@ with st.sidebar:
         help="Filter data from this date onward."
     )
     
-    # Query distinct balance bands
-    band_query = """
-        SELECT DISTINCT BALANCE_BAND
-        FROM BTC_DATA.DATA.ADDRESS_BALANCE_BANDS_DAILY
-        ORDER BY BALANCE_BAND
-    """
-    band_list_df = session.sql(band_query).to_pandas()
-    all_bands = band_list_df["BALANCE_BAND"].tolist()
+    # Distinct balance bands (cached)
+    all_bands = fetch_balance_bands(session)
     
     selected_bands = st.multiselect(
         "Select one or more balance bands:",
@@ -94,77 +96,134 @@ with st.sidebar:
 ######################################
 # 6) Main Chart
 ######################################
+# All bands live in one cached DATE x band matrix; selecting bands is a
+# column selection and a later start date is a slice
+band_matrix = load_band_matrix(session, selected_start_date)
+if band_matrix.empty:
+    st.warning("No data returned for the selected balance bands and date range.")
+    st.stop()
+
 if not selected_bands:
     st.warning("Please select at least one balance band.")
-    st.stop()
+else:
+    pivot_df = band_matrix[selected_bands].fillna(0)
 
-bands_str = ", ".join([f"'{b}'" for b in selected_bands])
-daily_counts_query = f"""
-    SELECT
-        DAY,
-        BALANCE_BAND,
-        ADDRESS_COUNT
-    FROM BTC_DATA.DATA.ADDRESS_BALANCE_BANDS_DAILY
-    WHERE DAY >= '{selected_start_date}'
-      AND BALANCE_BAND IN ({bands_str})
-    ORDER BY DAY
-"""
-bands_df = session.sql(daily_counts_query).to_pandas()
-if bands_df.empty:
-    st.warning("No data returned for the selected balance bands and date range.")
+    # If user wants EMA, compute it for every selected band in one call
+    if show_bands_ema:
+        ema_df = pivot_df.ewm(span=bands_ema_period).mean()
+
+    fig_bands = go.Figure()
+    for band in selected_bands:
+        # Original band trace
+        fig_bands.add_trace(
+            go.Scatter(
+                x=pivot_df.index,
+                y=pivot_df[band],
+                mode="lines",
+                name=band
+            )
+        )
+        # If EMA is enabled, add a dashed line
+        if show_bands_ema:
+            fig_bands.add_trace(
+                go.Scatter(
+                    x=ema_df.index,
+                    y=ema_df[band],
+                    mode="lines",
+                    name=f"EMA({bands_ema_period}) - {band}",
+                    line=dict(dash="dash"),
+                    opacity=0.7
+                )
+            )
+
+    fig_bands.update_layout(
+        paper_bgcolor="#000000",
+        plot_bgcolor="#000000",
+        title="Daily Address Count by Balance Band",
+        hovermode="x unified",
+        font=dict(color="#f0f2f6"),
+        legend=dict(x=0, y=1.05, bgcolor="rgba(0,0,0,0)", orientation="h")
+    )
+    fig_bands.update_xaxes(title_text="Date", gridcolor="#4f5b66")
+    fig_bands.update_yaxes(
+        title_text="Address Count",
+        type="log" if scale_option_bands == "Log" else "linear",
+        gridcolor="#4f5b66"
+    )
+
+    st.plotly_chart(fig_bands, use_container_width=True)
+
+######################################
+# 7) Band Cohorts
+######################################
+# Cohort definitions are cached (presets) or kept in the session (custom);
+# the band matrix is already cached, so switching cohorts only re-runs one
+# matrix product.
+st.header("Band Cohorts")
+
+cohort_source = st.selectbox(
+    "Cohort Definitions",
+    list(COHORT_PRESETS) + ["Custom"],
+    index=0,
+    help="Presets assign each band by its lower bound, parsed from the band label."
+)
+
+with st.expander("Define Custom Cohort"):
+    new_cohort_name = st.text_input("Cohort Name", value="")
+    new_cohort_bands = st.multiselect("Bands in Cohort", options=all_bands)
+    col_save, col_clear = st.columns(2)
+    if col_save.button("Save Cohort") and new_cohort_name and new_cohort_bands:
+        st.session_state["band_cohorts"][new_cohort_name] = new_cohort_bands
+    if col_clear.button("Clear Custom Cohorts"):
+        st.session_state["band_cohorts"] = {}
+
+if cohort_source == "Custom":
+    cohorts = st.session_state["band_cohorts"]
+else:
+    cohorts = preset_cohorts(all_bands, cohort_source)
+
+if not cohorts:
+    st.info("No cohorts defined yet: save a custom cohort or pick a preset.")
     st.stop()
 
-# Pivot so each band is a separate column
-pivot_df = bands_df.pivot(
-    index="DAY",
-    columns="BALANCE_BAND",
-    values="ADDRESS_COUNT"
-).fillna(0).reset_index()
+st.caption(" | ".join(f"**{name}**: {', '.join(members)}" for name, members in cohorts.items()))
 
-# If user wants EMA, compute for each band
-if show_bands_ema:
-    for band in selected_bands:
-        ema_column_name = f"EMA_{band}"
-        pivot_df[ema_column_name] = pivot_df[band].ewm(span=bands_ema_period).mean()
+cohort_view = st.radio(
+    "Cohort Metric",
+    ["Address Count", "Share of Addresses (%)", "Daily Change"],
+    index=1,
+    horizontal=True
+)
+cohort_frames = cohort_metrics(band_matrix, cohorts)
+cohort_df = cohort_frames[
+    {"Address Count": "sums", "Share of Addresses (%)": "shares", "Daily Change": "deltas"}[cohort_view]
+]
 
-fig_bands = go.Figure()
-for band in selected_bands:
-    # Original band trace
-    fig_bands.add_trace(
+fig_cohorts = go.Figure()
+for i, cohort in enumerate(cohort_df.columns):
+    fig_cohorts.add_trace(
         go.Scatter(
-            x=pivot_df["DAY"],
-            y=pivot_df[band],
+            x=cohort_df.index,
+            y=cohort_df[cohort],
             mode="lines",
-            name=band
+            name=cohort,
+            line=dict(color=st.session_state["color_palette"][i % len(st.session_state["color_palette"])])
         )
     )
-    # If EMA is enabled, add a dashed line
-    if show_bands_ema:
-        ema_col = f"EMA_{band}"
-        fig_bands.add_trace(
-            go.Scatter(
-                x=pivot_df["DAY"],
-                y=pivot_df[ema_col],
-                mode="lines",
-                name=f"EMA({bands_ema_period}) - {band}",
-                line=dict(dash="dash"),
-                opacity=0.7
-            )
-        )
 
-fig_bands.update_layout(
+fig_cohorts.update_layout(
     paper_bgcolor="#000000",
     plot_bgcolor="#000000",
-    title="Daily Address Count by Balance Band",
+    title=f"Band Cohorts - {cohort_view}",
     hovermode="x unified",
     font=dict(color="#f0f2f6"),
     legend=dict(x=0, y=1.05, bgcolor="rgba(0,0,0,0)", orientation="h")
 )
-fig_bands.update_xaxes(title_text="Date", gridcolor="#4f5b66")
-fig_bands.update_yaxes(
-    title_text="Address Count",
-    type="log" if scale_option_bands == "Log" else "linear",
+fig_cohorts.update_xaxes(title_text="Date", gridcolor="#4f5b66")
+fig_cohorts.update_yaxes(
+    title_text=cohort_view,
+    type="log" if scale_option_bands == "Log" and cohort_view == "Address Count" else "linear",
     gridcolor="#4f5b66"
 )
 
-st.plotly_chart(fig_bands, use_container_width=True)
+st.plotly_chart(fig_cohorts, use_container_width=True)
@@ -1,6 +1,11 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+import datetime
+
+from utils.hodl_engine import get_hodl_waves, parse_age_edges
+from utils.hodl_waves import fetch_age_buckets, load_hodl_matrix
 
 # Streamlit UI setup
 st.set_page_config(page_title="Bitcoin HODL Waves", layout="wide")
@@ -9,42 +14,59 @@ st.title("Bitcoin HODL Waves Visualization")
 cx = st.connection("snowflake")
 session = cx.session()
 
-# Query Data
-query = """
-    SELECT DATE, AGE_BUCKET, PERCENT_SUPPLY
-    FROM HODL_Waves
-    ORDER BY DATE ASC
-"""
-df = session.sql(query).to_pandas()
-
-# Convert date column to datetime
-df["DATE"] = pd.to_datetime(df["DATE"])
-
-# Filter out future dates
-today = pd.to_datetime("today").normalize()  # Get today's date without time
-df = df[df["DATE"] < today]
-
 # Sidebar Filters
 st.sidebar.header("Filter Data")
-selected_age_buckets = st.sidebar.multiselect(
-    "Select Age Buckets to Display", 
-    options=df["AGE_BUCKET"].unique(),
-    default=df["AGE_BUCKET"].unique()
+data_source = st.sidebar.radio(
+    "Data Source",
+    ["HODL_Waves table", "Computed from UTXO_LIFECYCLE"],
+    index=0,
+    help="The computed waves are replayed locally from UTXO creation/spend "
+         "events and support custom age buckets."
 )
-df_filtered = df[df["AGE_BUCKET"].isin(selected_age_buckets)]
-
-# Plotting with Plotly
-fig = px.area(
-    df_filtered,
-    x="DATE",
-    y="PERCENT_SUPPLY",
-    color="AGE_BUCKET",
-    title="Bitcoin HODL Waves Over Time (Before Today)",
-    labels={"SNAPSHOT_DATE": "Date", "PERCENT_SUPPLY": "Supply Percentage (%)"},
-    color_discrete_sequence=px.colors.qualitative.Set1
+if data_source == "Computed from UTXO_LIFECYCLE":
+    age_edges_text = st.sidebar.text_input(
+        "Age Bucket Edges",
+        value="1d, 1w, 1m, 3m, 6m, 1y, 2y, 3y, 5y, 7y, 10y",
+        help="Comma-separated lower age bounds (d, w, m = 30d, y = 365d)."
+    )
+    hodl_waves = get_hodl_waves(session, parse_age_edges(age_edges_text))
+    hodl_waves.refresh()  # appends the days completed since the last run
+    df_hodl_all = hodl_waves.shares()
+    all_age_buckets = list(df_hodl_all.columns)
+else:
+    all_age_buckets = fetch_age_buckets(session)
+
+selected_age_buckets = st.sidebar.multiselect(
+    "Select Age Buckets to Display",
+    options=all_age_buckets,
+    default=all_age_buckets
 )
+start_date = st.sidebar.date_input("Start Date", value=datetime.date(2010, 1, 1))
+
+selected_age_buckets = [b for b in all_age_buckets if b in selected_age_buckets]
+if data_source == "Computed from UTXO_LIFECYCLE":
+    df_hodl = df_hodl_all.loc[df_hodl_all.index >= pd.Timestamp(start_date), selected_age_buckets]
+else:
+    # Query Data: date range and buckets are filtered in SQL (dates before
+    # today only), the result is cached as a DATE x AGE_BUCKET float32 matrix
+    df_hodl = load_hodl_matrix(session, start_date, tuple(selected_age_buckets))
+
+# Plotting with Plotly: one stacked trace per matrix column
+colors = px.colors.qualitative.Set1
+fig = go.Figure()
+for i, bucket in enumerate(df_hodl.columns):
+    fig.add_trace(go.Scatter(
+        x=df_hodl.index,
+        y=df_hodl[bucket],
+        name=str(bucket),
+        mode="lines",
+        stackgroup="hodl",
+        line=dict(width=0.5, color=colors[i % len(colors)]),
+        hovertemplate="%{y:.2f}%"
+    ))
 
 fig.update_layout(
+    title="Bitcoin HODL Waves Over Time (Before Today)",
     xaxis_title="Date",
     yaxis_title="Percentage of Supply",
     legend_title="Age Bucket",
@@ -56,4 +78,4 @@ st.plotly_chart(fig, use_container_width=True)
 
 # Display Data Table
 #st.subheader("HODL Waves Data")
-#st.dataframe(df_filtered)
+#st.dataframe(df_hodl)
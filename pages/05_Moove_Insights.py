@@ -8,9 +8,12 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import datetime
 import random
-import calendar
 import io
 
+from utils.btc_price import load_ohlc
+from utils.metric_store import get_metric_store
+from utils.movement_stats import MOVEMENT_STATES, load_movement_states
+
 ######################################
 # 1) Page Configuration & Dark Theme
 ######################################
@@ -41,6 +44,7 @@ st.markdown(
 ######################################
 cx = st.connection("snowflake")  # Ensure your connection is configured
 session = cx.session()
+store = get_metric_store(session)
 
 ######################################
 # 3) Define Color Palette & Session State
@@ -61,9 +65,7 @@ if "colors" not in st.session_state:
 ######################################
 # 4) BTC Price Data Configuration
 ######################################
-BTC_PRICE_TABLE = "BTC_DATA.DATA.BTC_PRICE_USD"
-BTC_PRICE_DATE_COL = "DATE"
-BTC_PRICE_VALUE_COL = "BTC_PRICE_USD"
+# Daily BTC price is sliced from the process-wide series in utils.btc_price
 
 ######################################
 # 5) Page Title
@@ -82,7 +84,12 @@ with st.sidebar:
     st.markdown("---")
     st.header("Price Movement Detection")
     show_movement_scatter = st.checkbox("Show BTC Price Movement States?", value=True)
+    movement_span = st.radio("Movement Resolution", ["Weekly", "Daily"], index=0)
     movement_threshold = st.number_input("Threshold for unchanged state (%)", min_value=0.1, max_value=5.0, value=0.5)
+    significant_threshold = st.number_input(
+        "Threshold for significant movement (%)", min_value=0.1, max_value=50.0, value=5.0,
+        help="Movements beyond this are significant; between the two thresholds they are moderate."
+    )
 
     st.markdown("---")
     st.header("Date Range Selection")
@@ -97,29 +104,26 @@ with st.sidebar:
         selected_end_date = None
 
 ######################################
-# 7) BTC PRICE MOVEMENT QUERY
+# 7) BTC PRICE MOVEMENT STATES
 ######################################
-btc_movement_query = f"""
-    SELECT WEEK_START, AVG_PRICE, PRICE_MOVEMENT_STATE 
-    FROM BTC_DATA.DATA.BTC_PRICE_MOVEMENT_WEEKLY
-    WHERE AVG_PRICE IS NOT NULL
-      AND WEEK_START >= '{selected_start_date}'
-"""
-
-if selected_end_date:
-    btc_movement_query += f" AND WEEK_START <= '{selected_end_date}'"
-
-btc_movement_query += " ORDER BY WEEK_START"
-
-df_btc_movement = session.sql(btc_movement_query).to_pandas()
+# States are derived from the cached average price of each week (or day),
+# so changing the thresholds needs no query
+df_btc_movement = load_movement_states(
+    session,
+    movement_span,
+    movement_threshold,
+    significant_threshold,
+    selected_start_date,
+    selected_end_date
+)
 
 # Define mapping for five distinct states with colors and labels:
 state_color_label = {
-    -2: {"color": "#ad0c00", "label": "Decrease significantly"},
-    -1: {"color": "#ff6f00", "label": "Moderate decrease"},
-     0: {"color": "#fffb00", "label": "Unchanged"},
-     1: {"color": "#55ff00", "label": "Moderate increase"},
-     2: {"color": "#006e07", "label": "Increase significantly"}
+    -2: {"color": "#ad0c00", "label": MOVEMENT_STATES[-2]},
+    -1: {"color": "#ff6f00", "label": MOVEMENT_STATES[-1]},
+     0: {"color": "#fffb00", "label": MOVEMENT_STATES[0]},
+     1: {"color": "#55ff00", "label": MOVEMENT_STATES[1]},
+     2: {"color": "#006e07", "label": MOVEMENT_STATES[2]}
 }
 
 ######################################
@@ -130,7 +134,7 @@ if show_btc_price:
     if chart_type_price == "Line":
         fig.add_trace(
             go.Scatter(
-                x=df_btc_movement["WEEK_START"],
+                x=df_btc_movement["PERIOD"],
                 y=df_btc_movement["AVG_PRICE"],
                 mode="lines",
                 name="BTC Price (USD)",
@@ -141,7 +145,7 @@ if show_btc_price:
     else:
         fig.add_trace(
             go.Bar(
-                x=df_btc_movement["WEEK_START"],
+                x=df_btc_movement["PERIOD"],
                 y=df_btc_movement["AVG_PRICE"],
                 name="BTC Price (USD)",
                 marker_color="#3498DB"
@@ -150,19 +154,22 @@ if show_btc_price:
         )
 
 if show_movement_scatter:
-    for state in sorted(state_color_label.keys(), reverse=True):
-        state_data = df_btc_movement[df_btc_movement["PRICE_MOVEMENT_STATE"] == state]
-        if not state_data.empty:
-            fig.add_trace(
-                go.Scatter(
-                    x=state_data["WEEK_START"],
-                    y=state_data["AVG_PRICE"],
-                    mode="markers",
-                    marker=dict(color=state_color_label[state]["color"], size=6),
-                    name=state_color_label[state]["label"]
-                ),
-                secondary_y=True
-            )
+    # One groupby pass over the frame instead of one filter per state
+    state_groups = df_btc_movement.groupby("PRICE_MOVEMENT_STATE")  # NaN (first period) dropped
+    for state, state_data in reversed(list(state_groups)):
+        state = int(state)
+        fig.add_trace(
+            go.Scatter(
+                x=state_data["PERIOD"],
+                y=state_data["AVG_PRICE"],
+                mode="markers",
+                marker=dict(color=state_color_label[state]["color"], size=6),
+                name=state_color_label[state]["label"],
+                customdata=state_data["PRICE_MOVEMENT_PERCENT"],
+                hovertemplate="%{y:,.2f} USD (%{customdata:+.2f}%)"
+            ),
+            secondary_y=True
+        )
 
 fig.update_layout(
     title="Bitcoin Price & Movement States",
@@ -191,56 +198,12 @@ st.header("BTC Candlestick Chart")
 
 candle_span = st.selectbox("Select Candle Chart Span", ["Daily", "Weekly", "Monthly"], index=0)
 
+# Candles come from the precomputed OHLC pyramid; only the periods cut by
+# the selected range are rebuilt from daily prices
+df_candle = load_ohlc(session, candle_span, selected_start_date, selected_end_date)
+df_candle = df_candle.rename(columns={"PERIOD_END": "period_end"})
 if candle_span == "Daily":
-    period_expr = f"DATE_TRUNC('day', {BTC_PRICE_DATE_COL})"
-elif candle_span == "Weekly":
-    period_expr = (
-        f"DATEADD(day, CASE WHEN DAYOFWEEK({BTC_PRICE_DATE_COL}) = 1 "
-        f"THEN -6 ELSE 2 - DAYOFWEEK({BTC_PRICE_DATE_COL}) END, {BTC_PRICE_DATE_COL})"
-    )
-elif candle_span == "Monthly":
-    period_expr = f"DATE_TRUNC('month', {BTC_PRICE_DATE_COL})"
-
-candle_query = f"""
-WITH cte AS (
-    SELECT 
-        {period_expr} AS period,
-        {BTC_PRICE_DATE_COL} AS date,
-        {BTC_PRICE_VALUE_COL} AS price,
-        ROW_NUMBER() OVER (
-            PARTITION BY {period_expr}
-            ORDER BY {BTC_PRICE_DATE_COL} ASC
-        ) AS rn_asc,
-        ROW_NUMBER() OVER (
-            PARTITION BY {period_expr}
-            ORDER BY {BTC_PRICE_DATE_COL} DESC
-        ) AS rn_desc
-    FROM {BTC_PRICE_TABLE}
-    WHERE {BTC_PRICE_DATE_COL} >= '{selected_start_date}'
-"""
-if selected_end_date:
-    candle_query += f" AND {BTC_PRICE_DATE_COL} <= '{selected_end_date}'"
-candle_query += f"""
-)
-SELECT
-    period,
-    MAX(CASE WHEN rn_asc = 1 THEN price END) AS open,
-    MAX(price) AS high,
-    MIN(price) AS low,
-    MAX(CASE WHEN rn_desc = 1 THEN price END) AS close
-FROM cte
-GROUP BY period
-ORDER BY period
-"""
-
-df_candle = session.sql(candle_query).to_pandas()
-
-if candle_span == "Weekly":
-    df_candle['period_end'] = pd.to_datetime(df_candle['PERIOD']) + pd.Timedelta(days=6)
-elif candle_span == "Monthly":
-    df_candle['period_end'] = pd.to_datetime(df_candle['PERIOD']).apply(
-        lambda d: d.replace(day=calendar.monthrange(d.year, d.month)[1])
-    )
+    df_candle = df_candle.drop(columns="period_end")
 
 fig_candle = go.Figure(data=[go.Candlestick(
     x=df_candle["PERIOD"],
@@ -498,46 +461,22 @@ with st.sidebar:
 ######################################
 # Data Query & Merge for Correlation
 ######################################
-df_list = []
+table_specs = {}
 for tbl in selected_tables:
     tbl_info = TABLE_DICT[tbl]
-    date_col = tbl_info["date_col"]
     
     # Determine which numeric columns from this table are selected
-    table_features = {f"{tbl}:{col}" for col in tbl_info["numeric_cols"]}
-    features_to_query = table_features.intersection(set(selected_features))
-    if not features_to_query:
-        continue
-    
-    # Map to raw column names (remove prefix)
-    raw_cols = [feat.split(":", 1)[1] for feat in features_to_query]
-    cols_for_query = ", ".join(raw_cols)
-
-    query = f"""
-        SELECT
-            CAST({date_col} AS DATE) AS DATE,
-            {cols_for_query}
-        FROM {tbl_info['table_name']}
-        WHERE CAST({date_col} AS DATE) >= '{start_date_corr}'
-    """
-    if end_date_corr:
-        query += f" AND CAST({date_col} AS DATE) <= '{end_date_corr}'\n"
-    query += "ORDER BY DATE"
-
-    df_temp = session.sql(query).to_pandas()
-    # Rename raw columns to keep them unique (using raw column names)
-    rename_dict = {col: col for col in raw_cols}
-    df_temp.rename(columns=rename_dict, inplace=True)
-    df_list.append(df_temp)
+    raw_cols = [col for col in tbl_info["numeric_cols"] if f"{tbl}:{col}" in selected_features]
+    if raw_cols:
+        table_specs[tbl] = (tbl_info, raw_cols)
 
-if not df_list:
+if not table_specs:
     st.error("No data returned for selected tables/features.")
     st.stop()
 
-merged_df = df_list[0]
-for df in df_list[1:]:
-    merged_df = pd.merge(merged_df, df, on="DATE", how="outer")
-merged_df.sort_values("DATE", inplace=True)
+# One aligned wide frame (columns named "TABLE:COLUMN"); uncached tables are
+# fetched together in a single spine-join query instead of one query each.
+merged_df = store.load_wide(table_specs, start_date_corr, end_date_corr)
 merged_df = merged_df.dropna(how="all")
 
 ######################################
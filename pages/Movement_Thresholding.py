@@ -1,12 +1,19 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import datetime
 import random
 import ruptures as rpt
-from scipy.stats import norm, shapiro
+from scipy.stats import norm
+
+from utils.metric_store import REFRESH_INTERVAL_SECONDS
+from utils.movement_stats import (
+    MOVEMENT_COL, MOVEMENT_TABLE, fetch_histogram, fetch_moments, fetch_threshold_counts,
+    histogram, moments, movement_sql, normality, sorted_values, threshold_counts
+)
+from utils.query import run, sql
+from utils.range_cache import get_range_cache
 
 ######################################
 # 1) Page Configuration & Dark Theme
@@ -38,6 +45,7 @@ st.markdown(
 ######################################
 cx = st.connection("snowflake")
 session = cx.session()
+range_cache = get_range_cache()
 
 ######################################
 # 3) Define Color Palette & Session State
@@ -75,7 +83,6 @@ hist_start_date = st.sidebar.date_input(
     "Histogram Start Date", 
     value=datetime.date(2010, 7, 30)
 )
-hist_start_date_str = hist_start_date.strftime("%Y-%m-%d")
 
 # Slider for the number of bins in the histogram
 nbins_slider = st.sidebar.slider(
@@ -86,45 +93,78 @@ nbins_slider = st.sidebar.slider(
     step=10
 )
 
+# Where the histogram, moments and threshold counts are computed
+stats_source = st.sidebar.radio(
+    "Statistics Source",
+    ["Local cache", "Warehouse aggregates"],
+    index=0,
+    help="Local cache pulls the full series once and computes everything "
+         "locally, so slider changes need no query. Warehouse aggregates only "
+         "ship bin counts and moments, but each new bin count or threshold "
+         "is a new query."
+)
+
+# DATE > start date
+movement_start_date = hist_start_date + datetime.timedelta(days=1)
+
 # 4.1) Load the BTC price movement percentage from Snowflake
-query_movement = f"""
-SELECT
-    DATE,
-    AVG_PRICE,
-    PREV_AVG,
-    (AVG_PRICE - PREV_AVG)/NULLIF(PREV_AVG, 0) * 100 AS PRICE_MOVEMENT_PERCENT
-FROM BTC_PRICE_MOVEMENT_PERCENTAGE
-WHERE PREV_AVG IS NOT NULL AND DATE > '{hist_start_date_str}'
-"""
-df_movement = session.sql(query_movement).to_pandas()
-
-movement_data = df_movement["PRICE_MOVEMENT_PERCENT"].dropna()
-
-# 4.2) Check normality (Shapiro-Wilk Test) on the ENTIRE dataset
-stat, p_value = shapiro(movement_data)
+def fetch_movement(start_date, end_date):
+    """Fetch movement rows in [start_date, end_date], indexed by DATE."""
+    movement = movement_sql(start_date, end_date)
+    df = run(session, sql(movement.text + " ORDER BY DATE", *movement.params))
+    df["DATE"] = pd.to_datetime(df["DATE"])
+    return df.set_index("DATE")
+
+def load_movement(start_date):
+    """Movement rows from start_date on; later start dates are sliced from the cached range."""
+    return range_cache.get(
+        MOVEMENT_TABLE,
+        ["AVG_PRICE", "PREV_AVG", MOVEMENT_COL],
+        start_date,
+        None,
+        fetch_movement
+    ).reset_index()
+
+@st.cache_data(ttl=REFRESH_INTERVAL_SECONDS)
+def sorted_movement(start_date):
+    """Sorted, NaN-free movement percentages from start_date on."""
+    return sorted_values(load_movement(start_date)[MOVEMENT_COL])
+
+
+if stats_source == "Warehouse aggregates":
+    # 4.1) Moments, bin counts and threshold counts computed in Snowflake
+    movement_moments = fetch_moments(session, movement_start_date)
+    df_bins = fetch_histogram(
+        session, movement_start_date,
+        movement_moments["LOW"], movement_moments["HIGH"], nbins_slider
+    )
+    status_counts = fetch_threshold_counts(
+        session, movement_start_date, (no_change_threshold, -no_change_threshold)
+    )
+else:
+    # Sorted once per start date; slider changes only run searchsorted on it
+    movement_sorted = sorted_movement(movement_start_date)
+    movement_moments = moments(movement_sorted)
+    df_bins = histogram(movement_sorted, movement_moments["LOW"], movement_moments["HIGH"], nbins_slider)
+    status_counts = threshold_counts(movement_sorted, (no_change_threshold, -no_change_threshold))
 
-# 4.3) Mean and std on the entire dataset
-mean_val = movement_data.mean()
-std_val = movement_data.std()
-
-# Existing classification based on standard deviations
-df_movement["Movement_Category"] = df_movement["PRICE_MOVEMENT_PERCENT"].apply(
-    lambda x: "Significant Increase" if (x - mean_val) > std_slider * std_val else
-              ("Significant Decrease" if (x - mean_val) < -std_slider * std_val else
-               ("Slight Increase" if x > 0 else "Slight Decrease"))
-)
+# 4.2) Normality check (Jarque-Bera) from the moments of the ENTIRE dataset
+movement_normality = normality(movement_moments)
+stat, p_value = movement_normality["jb"], movement_normality["p_value"]
 
-# New classification for Increase/Decrease/No-Change
-df_movement["Price_Status"] = df_movement["PRICE_MOVEMENT_PERCENT"].apply(
-    lambda x: "Increase" if x > no_change_threshold else
-              ("Decrease" if x < -no_change_threshold else "No-Change")
-)
+# 4.3) Mean and std on the entire dataset
+mean_val = movement_moments["MEAN"]
+std_val = movement_normality["std"]
 
 ######################################
 # 4.4) Display normality test results and category stats
 ######################################
 st.subheader("BTC Price Movement Percentage - Normality Check (Full Data)")
-st.write(f"Shapiro-Wilk Test Statistic = {stat:.4f}, p-value = {p_value:.4f}")
+st.write(f"Jarque-Bera Test Statistic = {stat:.4f}, p-value = {p_value:.4f}")
+st.write(
+    f"Skewness = {movement_normality['skew']:.4f}, "
+    f"Excess Kurtosis = {movement_normality['kurtosis']:.4f} (n = {movement_moments['N']})"
+)
 
 if p_value < 0.05:
     st.write("**Conclusion**: The distribution is likely *not* normal (p < 0.05).")
@@ -137,7 +177,14 @@ st.write(f"Threshold for 'Significant' set at ±{std_slider} standard deviations
 st.write(f"No-Change Threshold set at ±{no_change_threshold}%.")
 
 # Display percentage of days in each Price_Status category
-category_counts = df_movement["Price_Status"].value_counts(normalize=True) * 100
+n_movement = max(movement_moments["N"], 1)
+increase_count = status_counts[no_change_threshold][0]
+decrease_count = status_counts[-no_change_threshold][1]
+category_counts = {
+    "Increase": increase_count / n_movement * 100,
+    "Decrease": decrease_count / n_movement * 100,
+    "No-Change": (movement_moments["N"] - increase_count - decrease_count) / n_movement * 100,
+}
 st.write("### Price Status Distribution")
 st.write(f"Percentage of days with Increase: {category_counts.get('Increase', 0):.2f}%")
 st.write(f"Percentage of days with Decrease: {category_counts.get('Decrease', 0):.2f}%")
@@ -147,13 +194,20 @@ st.write(f"Percentage of days with No-Change: {category_counts.get('No-Change',
 # 4.5) Plot histogram (full data) with thresholds
 ######################################
 fig_hist = go.Figure()
-fig_hist.add_trace(go.Histogram(x=movement_data, nbinsx=nbins_slider))
+fig_hist.add_trace(go.Bar(
+    x=(df_bins["LOW"] + df_bins["HIGH"]) / 2,
+    y=df_bins["COUNT"],
+    width=df_bins["HIGH"] - df_bins["LOW"],
+    customdata=df_bins[["LOW", "HIGH"]],
+    hovertemplate="%{customdata[0]:.2f}% to %{customdata[1]:.2f}%<br>Count: %{y}<extra></extra>"
+))
 fig_hist.add_vline(x=-no_change_threshold, line_dash="dash", line_color="red", annotation_text="Decrease Threshold")
 fig_hist.add_vline(x=no_change_threshold, line_dash="dash", line_color="red", annotation_text="Increase Threshold")
 fig_hist.update_layout(
     title="Distribution of BTC Movement (%) - Full Data",
     xaxis_title="BTC Movement (%)",
     yaxis_title="Count",
-    template="plotly_dark"
+    template="plotly_dark",
+    bargap=0
 )
 st.plotly_chart(fig_hist, use_container_width=True)
@@ -5,12 +5,18 @@ import datetime
 import random
 import io
 import math
+import os
 
 import plotly.graph_objs as go
 import plotly.express as px
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+from utils.btc_price import load_btc_price
+from utils.feature_memo import FeatureMemo
+from utils.metric_store import get_metric_store
+from utils.xcorr import correlation_cube, lagged_correlation, rank_best_lags
+
 ######################################
 # 1) Page Configuration & Dark Theme
 ######################################
@@ -41,6 +47,7 @@ st.markdown(
 ######################################
 cx = st.connection("snowflake")
 session = cx.session()
+store = get_metric_store(session)
 
 ######################################
 # 3) Define Color Palette & Session State
@@ -55,6 +62,10 @@ if "color_palette" not in st.session_state:
     random.shuffle(st.session_state["color_palette"])
 if "plot_lines" not in st.session_state:
     st.session_state["plot_lines"] = {}  # will hold final series for plotting
+if "feature_memo" not in st.session_state:
+    st.session_state["feature_memo"] = FeatureMemo()  # survives reruns of this session
+feature_memo = st.session_state["feature_memo"]
+feature_memo.begin_run()
 
 ######################################
 # 4) Table / Feature Mappings
@@ -297,28 +308,23 @@ with st.sidebar:
 ######################################
 # (B) Data Query & Transform for Correlation
 ######################################
-def load_feature(feature, start_date, end_date):
-    """Load a single feature (table column) from Snowflake within the given date range."""
+def _load_feature_uncached(feature, start_date, end_date):
+    """Load a single feature (table column) from the local metric store within the given date range."""
     tbl, col = feature.split(":", 1)
-    info = TABLE_DICT[tbl]
-    date_col = info["date_col"]
-    query = f"""
-        SELECT
-            CAST({date_col} AS DATE) AS DATE,
-            {col}
-        FROM {info['table_name']}
-        WHERE CAST({date_col} AS DATE) >= '{start_date}'
-    """
-    if end_date:
-        query += f" AND CAST({date_col} AS DATE) <= '{end_date}'"
-    query += " ORDER BY DATE"
-    
-    df = session.sql(query).to_pandas()
+    if tbl == "BTC PRICE":
+        # Sliced from the process-wide BTC price series
+        df = load_btc_price(session, start_date, end_date, columns=[col])
+    else:
+        df = store.load(TABLE_DICT[tbl], [col], start_date, end_date)
     df.rename(columns={col: feature}, inplace=True)
     df.sort_values("DATE", inplace=True)
     df.dropna(subset=[feature], inplace=True)
     return df.reset_index(drop=True)
 
+def load_feature(feature, start_date, end_date):
+    """Memoized `_load_feature_uncached`: each (feature, start, end) is loaded at most once."""
+    return feature_memo.get(feature, start_date, end_date, _load_feature_uncached)
+
 # Query and transform each selected feature
 dfs = {}
 for feat in selected_features:
@@ -523,9 +529,9 @@ else:
     
     # 6. Filter by plotting date range if specified
     if plot_start_date:
-        plot_df = plot_df[plot_df["DATE"] >= plot_start_date]
+        plot_df = plot_df[plot_df["DATE"] >= pd.Timestamp(plot_start_date)]
     if plot_end_date:
-        plot_df = plot_df[plot_df["DATE"] <= plot_end_date]
+        plot_df = plot_df[plot_df["DATE"] <= pd.Timestamp(plot_end_date)]
     
     # 7. Create the plot if we have data
     if plot_df.empty:
@@ -646,8 +652,8 @@ st.subheader("Lag-based Correlation: Single Indicator vs. BTC Price")
 st.markdown(
     """
     **Lag Explanation:**  
-    A **negative lag** (e.g., –1) means the indicator’s value from yesterday is compared with today’s BTC Price (the indicator leads the price).  
-    A **positive lag** would compare a future indicator with today’s BTC Price (the indicator lags behind).
+    A **positive lag** (e.g., 1) means the indicator’s value from yesterday is compared with today’s BTC Price (the indicator leads the price).  
+    A **negative lag** would compare a future indicator with today’s BTC Price (the indicator lags behind).
     """
 )
 
@@ -690,42 +696,28 @@ if indicator_deriv_lag:
     df_merge_lag[chosen_indicator_lag] = df_merge_lag[chosen_indicator_lag].diff()
 df_merge_lag.dropna(inplace=True)
 
+lag_values = list(range(int(min_lag), int(max_lag) + 1))
+
 if df_merge_lag.empty:
     st.warning("Not enough data to compute lag correlation.")
 else:
-    lag_values = list(range(int(min_lag), int(max_lag) + 1))
-    correlations = []
-    
-    for lag in lag_values:
-        df_temp = df_merge_lag.copy()
-        if lag != 0:
-            # If lag is positive, shifting the indicator downwards (using its past value)
-            # If lag is negative, this automatically shifts upwards (using a future value)
-            df_temp[chosen_indicator_lag] = df_temp[chosen_indicator_lag].shift(lag)
-        
-        df_temp.dropna(inplace=True)
-        
-        if len(df_temp) > 1:
-            if corr_method == "pearson":
-                corr_val = df_temp[[btc_feat_name, chosen_indicator_lag]].corr(method="pearson").iloc[0,1]
-            else:
-                corr_val = df_temp[[btc_feat_name, chosen_indicator_lag]].corr(method="spearman").iloc[0,1]
-        else:
-            corr_val = np.nan
-        
-        correlations.append(corr_val)
-    
-    df_lag_corr = pd.DataFrame({
-        "Lag": lag_values,
-        "Correlation": correlations
-    })
+    # Whole lag curve in one pass: pairs BTC[t] with indicator[t - lag], i.e.
+    # a positive lag uses the indicator's past value, a negative lag a future one.
+    df_lag_corr = lagged_correlation(
+        df_merge_lag[btc_feat_name].to_numpy(),
+        df_merge_lag[chosen_indicator_lag].to_numpy(),
+        lag_values,
+        method=corr_method
+    )
     
     fig_lag = go.Figure()
     fig_lag.add_trace(go.Scatter(
         x=df_lag_corr["Lag"],
         y=df_lag_corr["Correlation"],
         mode="lines+markers",
-        name="Correlation"
+        name="Correlation",
+        customdata=df_lag_corr["N"],
+        hovertemplate="Lag: %{x}<br>Correlation: %{y:.3f}<br>Samples: %{customdata}<extra></extra>"
     ))
     fig_lag.update_layout(
         title=f"Lag-Correlation: BTC_PRICE vs. {chosen_indicator_lag}",
@@ -745,3 +737,75 @@ else:
     best_lag = df_lag_corr["Lag"][max_corr_idx]
     best_corr = df_lag_corr["Correlation"][max_corr_idx]
     st.write(f"**Highest absolute correlation** occurs at lag = {best_lag} days, correlation = {best_corr:.3f}.")
+
+######################################
+# (G) Lag Scan: Every Feature vs. BTC Price
+######################################
+st.subheader("Lag Scan: All Features vs. BTC Price")
+
+with st.expander("Lag-Scan Settings", expanded=False):
+    st.write(
+        "Scans every numeric column of every table against BTC Price over the lag range "
+        "and derivative flags chosen above, and ranks features by their strongest lead/lag."
+    )
+    run_lag_scan = st.checkbox("Run lag scan for all features", value=False)
+    scan_workers = st.number_input(
+        "Worker processes (1 = run in-process)",
+        min_value=1, max_value=max(1, os.cpu_count() or 1), value=1, step=1
+    )
+
+if run_lag_scan:
+    scan_specs = {
+        tbl: (info, info["numeric_cols"]) for tbl, info in TABLE_DICT.items()
+    }
+    scan_df = store.load_wide(scan_specs, query_start_date, query_end_date).set_index("DATE")
+    if scan_df.empty:
+        # No rows in the range: min()/max() would be NaT and the calendar reindex would fail
+        st.info("No data in the selected date range to scan.")
+    else:
+        # Reindex onto a gap-free daily calendar so one row of lag is one day
+        scan_df = scan_df.reindex(pd.date_range(scan_df.index.min(), scan_df.index.max(), freq="D"))
+
+        reference = scan_df.pop(btc_feat_name)
+        if btc_deriv_lag:
+            reference = reference.diff()
+        if indicator_deriv_lag:
+            scan_df = scan_df.diff()
+
+        corr_cube, count_cube = correlation_cube(
+            reference, scan_df, lag_values, method=corr_method, workers=int(scan_workers)
+        )
+        ranking = rank_best_lags(corr_cube, count_cube)
+
+        st.write("**Best lead/lag per feature** (positive lag: the indicator leads BTC Price)")
+        st.dataframe(ranking, use_container_width=True)
+
+        ordered = corr_cube[ranking["Feature"]]
+        fig_cube = go.Figure(go.Heatmap(
+            z=ordered.T.to_numpy(),
+            x=ordered.index,
+            y=ordered.columns,
+            colorscale="RdBu_r",
+            zmin=-1,
+            zmax=1,
+            colorbar=dict(title="Correlation")
+        ))
+        fig_cube.update_layout(
+            title=f"{corr_method.capitalize()} Correlation by Feature and Lag",
+            xaxis_title="Lag (days)",
+            paper_bgcolor="black",
+            plot_bgcolor="black",
+            font=dict(color="white"),
+            height=max(400, 22 * len(ordered.columns))
+        )
+        st.plotly_chart(fig_cube, use_container_width=True)
+
+######################################
+# (H) Feature Load Memoization Stats
+######################################
+with st.sidebar:
+    st.markdown("---")
+    st.caption(
+        f"Feature loads saved by memoization: {feature_memo.run_hits} this rerun, "
+        f"{feature_memo.total_hits} this session ({feature_memo.total_loads} actual loads)."
+    )
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from utils.block_explorer import next_page_cursor
+
+
+def _page(n, coinbase_first=True):
+    return pd.DataFrame({
+        "TX_ID": [f"{i:04x}" for i in range(n)],
+        "IS_COINBASE": [coinbase_first and i == 0 for i in range(n)],
+    })
+
+
+def test_next_page_cursor_after_a_full_page():
+    assert next_page_cursor(_page(3), page_size=3) == (False, "0002")
+
+
+def test_next_page_cursor_on_a_coinbase_only_page():
+    assert next_page_cursor(_page(1), page_size=1) == (True, "0000")
+
+
+def test_no_cursor_after_the_last_page():
+    assert next_page_cursor(_page(2), page_size=3) is None
+    assert next_page_cursor(_page(0), page_size=3) is None
+
+
+def test_cursor_values_are_plain_python_types():
+    is_coinbase, tx_id = next_page_cursor(_page(2), page_size=2)
+    assert type(is_coinbase) is bool
+    assert type(tx_id) is str
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+import ruptures as rpt
+
+from utils.cpd import CumsumCost, binseg, pelt
+
+
+def _signal(seed=0):
+    rng = np.random.default_rng(seed)
+    means = np.repeat([0.0, 3.0, -1.0, 2.0], [60, 40, 80, 50])
+    return means + rng.normal(scale=0.5, size=len(means))
+
+
+@pytest.mark.parametrize("pen", [1.0, 5.0, 20.0])
+def test_pelt_matches_ruptures_l2(pen):
+    signal = _signal()
+    expected = rpt.Pelt(model="l2", min_size=2, jump=1).fit(signal).predict(pen=pen)
+    assert pelt(CumsumCost(signal), pen) == expected
+
+
+@pytest.mark.parametrize("pen", [5.0, 20.0])
+def test_binseg_matches_ruptures_l2(pen):
+    signal = _signal(1)
+    expected = rpt.Binseg(model="l2", min_size=2, jump=1).fit(signal).predict(pen=pen)
+    assert binseg(CumsumCost(signal), pen) == expected
+
+
+def test_cumsum_cost_matches_ruptures_sum_of_costs():
+    signal = _signal(2)
+    bkps = [60, 100, 180, len(signal)]
+    expected = rpt.costs.CostL2().fit(signal).sum_of_costs(bkps)
+    assert CumsumCost(signal).sum_of_costs(bkps) == pytest.approx(expected)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from utils.movement_stats import histogram, moments, normality, sorted_values, threshold_counts
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(0)
+    x = rng.standard_t(4, size=2000)
+    x[::97] = np.nan
+    return x
+
+
+def test_histogram_matches_numpy(values):
+    x = sorted_values(values)
+    low, high = x[0], x[-1]
+    bins = histogram(x, low, high, 25)
+    expected, edges = np.histogram(x, bins=25, range=(low, high))
+    assert bins["COUNT"].tolist() == expected.tolist()
+    assert bins["LOW"].to_numpy() == pytest.approx(edges[:-1])
+    assert bins["HIGH"].to_numpy() == pytest.approx(edges[1:])
+
+
+def test_histogram_puts_the_maximum_in_the_last_bin():
+    bins = histogram(np.array([0.0, 1.0, 2.0]), 0.0, 2.0, 2)
+    assert bins["COUNT"].tolist() == [1, 2]
+
+
+def test_threshold_counts_match_brute_force(values):
+    x = sorted_values(values)
+    counts = threshold_counts(x, (0.5, -0.5, 0.0))
+    for t, (above, below) in counts.items():
+        assert above == int((x > t).sum())
+        assert below == int((x < t).sum())
+
+
+def test_threshold_counts_exclude_ties():
+    assert threshold_counts(np.array([-1.0, 0.0, 0.0, 2.0]), (0.0,)) == {0.0: (1, 1)}
+
+
+def test_moments_and_normality(values):
+    x = values[np.isfinite(values)]
+    m = moments(values)
+    assert m["N"] == len(x)
+    assert m["MEAN"] == pytest.approx(x.mean())
+    stats = normality(m)
+    assert stats["std"] == pytest.approx(x.std(ddof=1))
+    scipy_stats = pytest.importorskip("scipy.stats")
+    jb = scipy_stats.jarque_bera(x)
+    assert stats["jb"] == pytest.approx(jb.statistic)
+    assert stats["p_value"] == pytest.approx(jb.pvalue)
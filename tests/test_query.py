@@ -0,0 +1,45 @@
+import datetime
+
+from utils.query import Where, literal, normalize, sql
+
+
+def test_normalize_strips_comments_and_collapses_whitespace():
+    text = """
+        SELECT  A,   -- first column
+                B
+        FROM T
+    """
+    assert normalize(text) == "SELECT A, B FROM T"
+
+
+def test_normalize_keeps_quoted_spans():
+    text = "SELECT \"A  B\" FROM T WHERE X = 'x  -- y' -- tail"
+    assert normalize(text) == "SELECT \"A  B\" FROM T WHERE X = 'x  -- y'"
+
+
+def test_normalize_keeps_doubled_quotes_inside_literals():
+    assert normalize("X = 'it''s  -- here'  AND  Y") == "X = 'it''s  -- here' AND Y"
+
+
+def test_literal_escapes_quotes_and_backslashes():
+    assert literal("it's") == "'it''s'"
+    assert literal("a\\") == "'a\\\\'"
+
+
+def test_literal_survives_sql():
+    query = sql("SELECT * FROM T WHERE X = " + literal("x  -- y"))
+    assert query.text == "SELECT * FROM T WHERE X = 'x  -- y'"
+
+
+def test_where_date_range_is_half_open_on_the_native_column():
+    where = Where().date_range("DATE", datetime.date(2020, 1, 1), datetime.date(2020, 1, 31))
+    assert str(where) == "WHERE DATE >= ? AND DATE < ?"
+    assert where.params == ["2020-01-01", "2020-02-01"]
+
+
+def test_where_is_in_binds_values():
+    where = Where().is_in("BUCKET", ["a", "b"])
+    assert str(where) == "WHERE BUCKET IN (?, ?)"
+    assert where.params == ["a", "b"]
+    assert str(Where().is_in("BUCKET", [])) == "WHERE FALSE"
+    assert str(Where()) == ""
@@ -0,0 +1,140 @@
+"""
+Address balance bands as a cached DATE x BALANCE_BAND matrix.
+
+ADDRESS_BALANCE_BANDS_DAILY is long (DAY, BALANCE_BAND, ADDRESS_COUNT). All
+bands are pivoted in the warehouse once into a float64 matrix kept by the
+metric store (and refreshed incrementally like any other table), so picking
+bands is a column selection rather than a new query.
+
+Bands can be merged into cohorts (e.g. "shrimp", "whales", "<1 BTC"): a
+cohort is a list of bands, and all cohort totals come from one matrix
+product of the band matrix with a band x cohort membership matrix.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.metric_store import REFRESH_INTERVAL_SECONDS, get_metric_store
+from utils.query import run, sql
+from utils.range_cache import slice_dates
+
+BALANCE_BANDS_TABLE = "BTC_DATA.DATA.ADDRESS_BALANCE_BANDS_DAILY"
+BALANCE_BANDS_INFO = {
+    "table_name": BALANCE_BANDS_TABLE,
+    "date_col": "DAY",
+    "pivot": {"column": "BALANCE_BAND", "value": "ADDRESS_COUNT"}
+}
+
+
+@st.cache_data(ttl=REFRESH_INTERVAL_SECONDS)
+def fetch_balance_bands(_session):
+    """All BALANCE_BAND labels, sorted."""
+    band_query = sql(f"""
+        SELECT DISTINCT BALANCE_BAND
+        FROM {BALANCE_BANDS_TABLE}
+        ORDER BY BALANCE_BAND
+    """)
+    return run(_session, band_query)["BALANCE_BAND"].tolist()
+
+
+def load_band_matrix(session, start_date=None, end_date=None):
+    """
+    DATE-indexed float64 matrix of ADDRESS_COUNT with one column per band,
+    restricted to [start_date, end_date]. Shared with the store: treat it
+    as read-only.
+    """
+    table_info = {**BALANCE_BANDS_INFO, "numeric_cols": fetch_balance_bands(session)}
+    return slice_dates(get_metric_store(session).table(table_info), start_date, end_date)
+
+
+######################################
+# Cohorts
+######################################
+_NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?\s*[kKmM]?")
+_MULTIPLIERS = {"k": 1e3, "m": 1e6}
+
+# Preset name -> [(cohort name, lower BTC bound, upper BTC bound)]
+COHORT_PRESETS = {
+    "Holder size": [
+        ("Shrimp (<1 BTC)", 0, 1),
+        ("Crab (1-10 BTC)", 1, 10),
+        ("Octopus (10-50 BTC)", 10, 50),
+        ("Fish (50-100 BTC)", 50, 100),
+        ("Dolphin (100-500 BTC)", 100, 500),
+        ("Shark (500-1k BTC)", 500, 1_000),
+        ("Whale (1k-5k BTC)", 1_000, 5_000),
+        ("Humpback (>5k BTC)", 5_000, np.inf),
+    ],
+    "Under / over 1 BTC": [
+        ("<1 BTC", 0, 1),
+        (">=1 BTC", 1, np.inf),
+    ],
+    "Retail / whales (1k BTC)": [
+        ("Retail (<1k BTC)", 0, 1_000),
+        ("Whales (>=1k BTC)", 1_000, np.inf),
+    ],
+}
+
+
+def _parse_amount(text):
+    text = text.replace(",", "").strip()
+    multiplier = _MULTIPLIERS.get(text[-1].lower(), 1) if text[-1].isalpha() else 1
+    return float(text.rstrip("kKmM ").strip()) * multiplier
+
+
+def band_bounds(label):
+    """
+    (lower, upper) BTC bounds of a band label such as "0.01 - 0.1",
+    "[1, 10)", "<0.001" or "10k+"; (nan, nan) when no amount is found.
+    """
+    amounts = [_parse_amount(m) for m in _NUMBER.findall(str(label))]
+    if not amounts:
+        return np.nan, np.nan
+    text = str(label).strip()
+    if len(amounts) >= 2:
+        return amounts[0], amounts[1]
+    if text.startswith("<"):
+        return 0.0, amounts[0]
+    return amounts[0], np.inf
+
+
+@st.cache_data
+def preset_cohorts(bands, preset):
+    """{cohort name: [bands]} of a COHORT_PRESETS entry, by each band's lower bound."""
+    cohorts = {}
+    for name, low, high in COHORT_PRESETS[preset]:
+        members = [b for b in bands if low <= band_bounds(b)[0] < high]
+        if members:
+            cohorts[name] = members
+    return cohorts
+
+
+def membership_matrix(bands, cohorts):
+    """bands x cohorts 0/1 float64 matrix: entry (i, j) is 1 when band i is in cohort j."""
+    position = {band: i for i, band in enumerate(bands)}
+    matrix = np.zeros((len(bands), len(cohorts)))
+    for j, members in enumerate(cohorts.values()):
+        rows = [position[b] for b in members if b in position]
+        matrix[rows, j] = 1.0
+    return matrix
+
+
+def cohort_metrics(band_matrix, cohorts):
+    """
+    Cohort address counts, share of all addresses (%) and daily change, as
+    three DATE x cohort frames, from one (dates x bands) @ (bands x cohorts)
+    product over the band matrix. The product runs in float64: float32 is
+    only exact up to 2**24, well below the address count of a large cohort.
+    """
+    values = band_matrix.fillna(0).to_numpy(dtype=np.float64)
+    sums = pd.DataFrame(
+        values @ membership_matrix(list(band_matrix.columns), cohorts),
+        index=band_matrix.index,
+        columns=list(cohorts)
+    )
+    total = values.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shares = sums.div(np.where(total > 0, total, np.nan), axis=0) * 100
+    return {"sums": sums, "shares": shares, "deltas": sums.diff()}
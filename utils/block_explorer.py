@@ -0,0 +1,455 @@
+"""
+Block Explorer data access with an immutable-block cache.
+
+A block that is CONFIRMATION_DEPTH blocks below the chain tip is not going
+to be reorganized away, so its FACT_BLOCKS row, its transactions and their
+inputs / outputs never change. Lookups (keyed by block number, block hash
+or TX_ID) are kept in one process-wide, size-bounded LRU:
+
+- results of confirmed blocks stay until evicted by newer lookups
+- results near the tip (or not found yet) expire after TIP_TTL_SECONDS
+
+so reruns of the page (e.g. switching a view mode) only re-query the tip.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import streamlit as st
+
+from utils.query import Where, run, sql
+
+CORE_SCHEMA = "BITCOIN_ONCHAIN_CORE_DATA.CORE"
+FACT_BLOCKS = f"{CORE_SCHEMA}.FACT_BLOCKS"
+FACT_TRANSACTIONS = f"{CORE_SCHEMA}.FACT_TRANSACTIONS"
+FACT_INPUTS = f"{CORE_SCHEMA}.FACT_INPUTS"
+FACT_OUTPUTS = f"{CORE_SCHEMA}.FACT_OUTPUTS"
+
+# Blocks with at least this many confirmations are treated as immutable
+CONFIRMATION_DEPTH = 6
+BLOCK_CACHE_MAX_ENTRIES = 2048
+# Lookups in flight at once (shared by every user session)
+FETCH_WORKERS = 8
+# Transactions per page of a block listing
+TX_PAGE_SIZE = 100
+# How long the tip height and unconfirmed results are reused
+TIP_TTL_SECONDS = 60
+
+BLOCK_COLUMNS = (
+    "BLOCK_NUMBER",
+    "BLOCK_HASH",
+    "BLOCK_TIMESTAMP",
+    "SIZE",
+    "TX_COUNT",
+    "VERSION",
+    "INSERTED_TIMESTAMP",
+    "MODIFIED_TIMESTAMP",
+)
+
+# FEE is in BTC. The INPUTS / OUTPUTS JSON columns are left out: they are
+# read page by page (json_overview) or on demand (transaction_json).
+TRANSACTION_COLUMNS = (
+    "BLOCK_NUMBER",
+    "BLOCK_TIMESTAMP",
+    "BLOCK_HASH",
+    "TX_ID",
+    "TX_HASH",
+    "FEE",
+    "IS_COINBASE",
+    "INPUT_COUNT",
+    "OUTPUT_COUNT",
+    "INPUT_VALUE",
+    "OUTPUT_VALUE",
+    "OUTPUT_VALUE_SATS",
+    "SIZE",
+    "WEIGHT",
+    "VERSION",
+    "LOCK_TIME",
+)
+
+# Elements per page of an INPUTS / OUTPUTS overview
+JSON_PAGE_SIZE = 100
+
+# JSON column -> {overview column: projection of a FLATTEN element}
+JSON_OVERVIEW_FIELDS = {
+    "INPUTS": {
+        "TXID": "f.VALUE:txid::STRING",
+        "Vout": "f.VALUE:vout::NUMBER",
+        "ASM": "f.VALUE:scriptSig:asm::STRING",
+        "Sequence": "f.VALUE:sequence::NUMBER",
+        "Witness Count": "COALESCE(ARRAY_SIZE(f.VALUE:txinwitness), 0)",
+    },
+    "OUTPUTS": {
+        "Index (n)": "f.VALUE:n::NUMBER",
+        "Value (BTC)": "f.VALUE:value::FLOAT",
+        "ScriptPubKey Type": "f.VALUE:scriptPubKey:type::STRING",
+        "Address": "f.VALUE:scriptPubKey:address::STRING",
+    },
+}
+
+# Search matches, in order of precedence
+MATCH_TYPES = ("block_number", "block_hash", "tx_id")
+RESOLVED_COLUMNS = BLOCK_COLUMNS + tuple(c for c in TRANSACTION_COLUMNS if c not in BLOCK_COLUMNS)
+
+
+def _select_list(columns, padded_to=None):
+    """Comma-separated `columns`, padded with NULLs to the `padded_to` layout."""
+    if padded_to is None:
+        return ", ".join(columns)
+    return ", ".join(c if c in columns else f"NULL AS {c}" for c in padded_to)
+
+
+def _json_fields(column):
+    """Overview fields of a JSON column; ValueError for anything but INPUTS / OUTPUTS."""
+    if column not in JSON_OVERVIEW_FIELDS:
+        raise ValueError(f"Unknown JSON column: {column}")
+    return JSON_OVERVIEW_FIELDS[column]
+
+
+def _block_number(frame):
+    """Block number of the rows of a lookup result, None when empty."""
+    if frame.empty or "BLOCK_NUMBER" not in frame:
+        return None
+    return int(frame["BLOCK_NUMBER"].max())
+
+
+def next_page_cursor(page, page_size=TX_PAGE_SIZE):
+    """(IS_COINBASE, TX_ID) keyset cursor after a full page, None after the last page."""
+    if len(page) < page_size:
+        return None
+    last = page.iloc[-1]
+    return bool(last["IS_COINBASE"]), str(last["TX_ID"])
+
+
+class BlockCache:
+    """LRU of Block Explorer lookups; entries of confirmed blocks never expire."""
+
+    def __init__(self, session, depth=CONFIRMATION_DEPTH, max_entries=BLOCK_CACHE_MAX_ENTRIES,
+                 tip_ttl=TIP_TTL_SECONDS):
+        self.session = session
+        self.depth = depth
+        self.max_entries = max_entries
+        self.tip_ttl = tip_ttl
+        self._entries = OrderedDict()  # key -> (expires_at | None, frame)
+        self._tip = (0.0, None)        # (fetched_at, height)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="block-cache")
+        self._prefetches = {}          # page key -> Future of a page loading in the background
+        self.hits = 0
+        self.loads = 0
+
+    ######################################
+    # Lookups (results are shared: treat them as read-only)
+    ######################################
+    def block(self, block_number):
+        """FACT_BLOCKS row of a block number (empty frame when unknown)."""
+        block_number = int(block_number)
+        return self._get(("block", block_number), lambda: run(self.session, sql(f"""
+            SELECT {_select_list(BLOCK_COLUMNS)}
+            FROM {FACT_BLOCKS}
+            WHERE BLOCK_NUMBER = ?
+            LIMIT 1
+        """, block_number)))
+
+    def block_by_hash(self, block_hash):
+        """FACT_BLOCKS row of a block hash (empty frame when unknown)."""
+        frame = self._get(("block_hash", block_hash), lambda: run(self.session, sql(f"""
+            SELECT {_select_list(BLOCK_COLUMNS)}
+            FROM {FACT_BLOCKS}
+            WHERE BLOCK_HASH = ?
+            LIMIT 1
+        """, block_hash)))
+        if not frame.empty:
+            self._put(("block", _block_number(frame)), frame)
+        return frame
+
+    def transaction(self, tx_id):
+        """
+        FACT_TRANSACTIONS row of a TX_ID (TRANSACTION_COLUMNS). The INPUTS /
+        OUTPUTS JSON is not included: page it with json_overview, or read it
+        with json_length / transaction_json.
+        """
+        return self._get(("transaction", tx_id), lambda: run(self.session, sql(f"""
+            SELECT {_select_list(TRANSACTION_COLUMNS)}
+            FROM {FACT_TRANSACTIONS}
+            WHERE TX_ID = ?
+            LIMIT 1
+        """, tx_id)))
+
+    def json_overview(self, tx_id, column, page=0, page_size=JSON_PAGE_SIZE):
+        """
+        Page `page` (0-based) of the INPUTS or OUTPUTS overview of a TX_ID.
+
+        The JSON array is flattened in the warehouse (LATERAL FLATTEN) and
+        only the projected fields of the elements at positions
+        [page * page_size, (page + 1) * page_size) are returned, so a
+        transaction with thousands of inputs is never downloaded whole.
+        """
+        fields = _json_fields(column)
+        projection = ", ".join(f'{expr} AS "{name}"' for name, expr in fields.items())
+        start = page * page_size
+        frame = self._get(("json_overview", tx_id, column, page, page_size), lambda: run(self.session, sql(f"""
+            SELECT t.BLOCK_NUMBER, {projection}
+            FROM {FACT_TRANSACTIONS} t,
+                LATERAL FLATTEN(input => t.{column}) f
+            WHERE t.TX_ID = ?
+              AND f.INDEX >= ?
+              AND f.INDEX < ?
+            ORDER BY f.INDEX
+        """, tx_id, start, start + page_size)))
+        return frame[list(fields)]
+
+    def json_length(self, tx_id, column):
+        """
+        Number of elements of the INPUTS or OUTPUTS array of a TX_ID, read
+        from the JSON itself; None when the column is missing or not an array.
+        The column must be a VARIANT (ARRAY_SIZE does not parse JSON text).
+        """
+        _json_fields(column)
+        frame = self._get(("json_length", tx_id, column), lambda: run(self.session, sql(f"""
+            SELECT BLOCK_NUMBER, ARRAY_SIZE({column}) AS N_ELEMENTS
+            FROM {FACT_TRANSACTIONS}
+            WHERE TX_ID = ?
+            LIMIT 1
+        """, tx_id)))
+        if frame.empty or pd.isna(frame["N_ELEMENTS"].iloc[0]):
+            return None
+        return int(frame["N_ELEMENTS"].iloc[0])
+
+    def transaction_json(self, tx_id, column):
+        """
+        The raw INPUTS or OUTPUTS JSON text of a TX_ID (None when absent).
+        Like json_length and json_overview (FLATTEN), this expects the
+        column to be a VARIANT.
+        """
+        _json_fields(column)
+        frame = self._get(("json", tx_id, column), lambda: run(self.session, sql(f"""
+            SELECT BLOCK_NUMBER, {column}
+            FROM {FACT_TRANSACTIONS}
+            WHERE TX_ID = ?
+            LIMIT 1
+        """, tx_id)))
+        return None if frame.empty else frame[column].iloc[0]
+
+    def inputs(self, tx_id):
+        """First 50 FACT_INPUTS rows of a TX_ID."""
+        return self._get(("inputs", tx_id), lambda: run(self.session, sql(f"""
+            SELECT
+                BLOCK_TIMESTAMP,
+                BLOCK_NUMBER,
+                BLOCK_HASH,
+                TX_ID,
+                INDEX,
+                IS_COINBASE,
+                SPENT_TX_ID,
+                SPENT_OUTPUT_INDEX,
+                VALUE,
+                VALUE_SATS,
+                INPUT_ID
+            FROM {FACT_INPUTS}
+            WHERE TX_ID = ?
+            LIMIT 50
+        """, tx_id)))
+
+    def outputs(self, tx_id):
+        """First 50 FACT_OUTPUTS rows of a TX_ID."""
+        return self._get(("outputs", tx_id), lambda: run(self.session, sql(f"""
+            SELECT
+                BLOCK_TIMESTAMP,
+                BLOCK_NUMBER,
+                BLOCK_HASH,
+                TX_ID,
+                INDEX,
+                VALUE,
+                VALUE_SATS,
+                OUTPUT_ID
+            FROM {FACT_OUTPUTS}
+            WHERE TX_ID = ?
+            LIMIT 50
+        """, tx_id)))
+
+    def transaction_details(self, tx_id):
+        """
+        Yield ("transaction" | "inputs" | "outputs", frame) for a TX_ID in
+        completion order. The three lookups are independent and run
+        concurrently on the shared pool, so the total latency is that of
+        the slowest query rather than the sum.
+        """
+        futures = {
+            self._pool.submit(lookup, tx_id): name
+            for name, lookup in (("transaction", self.transaction), ("inputs", self.inputs), ("outputs", self.outputs))
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def transaction_page(self, block_number, after=None, page_size=TX_PAGE_SIZE):
+        """
+        One page of a block's transactions, coinbase first, then by TX_ID.
+
+        Pages are keyset-paginated: `after` is the (IS_COINBASE, TX_ID) of
+        the last row of the previous page (see next_page_cursor), None for
+        the first page, so every page costs one index range scan of
+        `page_size` rows however deep it is. Pages are cached like any
+        other lookup, and the next page is prefetched in the background.
+        """
+        block_number = int(block_number)
+        key = ("transaction_page", block_number, after, page_size)
+        with self._lock:
+            pending = self._prefetches.get(key)
+        if pending is not None:
+            page = pending.result()
+        else:
+            page = self._get(key, lambda: self._fetch_page(block_number, after, page_size), height=block_number)
+        cursor = next_page_cursor(page, page_size)
+        if cursor is not None:
+            self._prefetch(block_number, cursor, page_size)
+        return page
+
+    def resolve(self, search_input):
+        """
+        (match type, detail row) of a search input in one round trip: the
+        input is tried as a block number, a block hash and a TX_ID in a
+        single UNION ALL, and the first match (see MATCH_TYPES) comes back
+        with the full FACT_BLOCKS or FACT_TRANSACTIONS row. The row also
+        seeds the block / transaction lookups. (None, empty frame) when
+        nothing matches.
+        """
+        frame = self._get(("search", search_input), lambda: run(self.session, sql(f"""
+            SELECT * FROM (
+                SELECT 'block_number' AS MATCH_TYPE, 1 AS PRIORITY,
+                    {_select_list(BLOCK_COLUMNS, RESOLVED_COLUMNS)}
+                FROM {FACT_BLOCKS}
+                WHERE BLOCK_NUMBER = TRY_TO_NUMBER(?)
+                UNION ALL
+                SELECT 'block_hash', 2,
+                    {_select_list(BLOCK_COLUMNS, RESOLVED_COLUMNS)}
+                FROM {FACT_BLOCKS}
+                WHERE BLOCK_HASH = ?
+                UNION ALL
+                SELECT 'tx_id', 3,
+                    {_select_list(TRANSACTION_COLUMNS, RESOLVED_COLUMNS)}
+                FROM {FACT_TRANSACTIONS}
+                WHERE TX_ID = ?
+            )
+            ORDER BY PRIORITY
+            LIMIT 1
+        """, search_input, search_input, search_input)))
+        if frame.empty:
+            return None, frame
+        match_type = frame["MATCH_TYPE"].iloc[0]
+        if match_type == "tx_id":
+            row = frame[list(TRANSACTION_COLUMNS)].reset_index(drop=True)
+            self._put(("transaction", row["TX_ID"].iloc[0]), row)
+        else:
+            row = frame[list(BLOCK_COLUMNS)].reset_index(drop=True)
+            self._put(("block", _block_number(row)), row)
+            self._put(("block_hash", row["BLOCK_HASH"].iloc[0]), row)
+        return match_type, row
+
+    def tip(self):
+        """Current chain tip height, re-queried at most every tip_ttl seconds."""
+        with self._lock:
+            fetched_at, height = self._tip
+            if height is not None and time.time() - fetched_at <= self.tip_ttl:
+                return height
+        df = run(self.session, sql(f"SELECT MAX(BLOCK_NUMBER) AS TIP FROM {FACT_BLOCKS}"))
+        height = None if df.empty or pd.isna(df["TIP"].iloc[0]) else int(df["TIP"].iloc[0])
+        with self._lock:
+            self._tip = (time.time(), height)
+        return height
+
+    def is_confirmed(self, block_number):
+        """True when `block_number` is at least `depth` blocks deep."""
+        if block_number is None:
+            return False
+        tip = self.tip()
+        return tip is not None and tip - int(block_number) + 1 >= self.depth
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tip = (0.0, None)
+
+    ######################################
+    # Internal helpers
+    ######################################
+    def _fetch_page(self, block_number, after, page_size):
+        where = Where().add("BLOCK_NUMBER = ?", block_number)
+        if after is not None:
+            is_coinbase, tx_id = after
+            where.add("(IS_COINBASE < ? OR (IS_COINBASE = ? AND TX_ID > ?))", is_coinbase, is_coinbase, tx_id)
+        return run(self.session, sql(f"""
+            SELECT
+                TX_ID,
+                INPUT_COUNT,
+                OUTPUT_COUNT,
+                OUTPUT_VALUE_SATS,
+                FEE,
+                IS_COINBASE
+            FROM {FACT_TRANSACTIONS}
+            {where}
+            ORDER BY IS_COINBASE DESC, TX_ID
+            LIMIT ?
+        """, *where.params, page_size))
+
+    def _prefetch(self, block_number, after, page_size):
+        """Load the page after `after` on the pool unless it is cached (and fresh) or already loading."""
+        key = ("transaction_page", block_number, after, page_size)
+        with self._lock:
+            if self._fresh(key) is not None or key in self._prefetches:
+                return
+            future = self._pool.submit(
+                self._get, key, lambda: self._fetch_page(block_number, after, page_size), block_number
+            )
+            self._prefetches[key] = future
+        future.add_done_callback(lambda _: self._forget_prefetch(key))
+
+    def _forget_prefetch(self, key):
+        with self._lock:
+            self._prefetches.pop(key, None)
+
+    def _fresh(self, key):
+        """The cached frame of `key` unless missing or expired (expired entries are dropped). Needs the lock."""
+        cached = self._entries.get(key)
+        if cached is None:
+            return None
+        expires_at, frame = cached
+        if expires_at is not None and time.time() >= expires_at:
+            del self._entries[key]
+            return None
+        return frame
+
+    def _get(self, key, fetch, height=None):
+        """
+        Cached result of `fetch()` for `key`. The block height deciding
+        whether it may be kept is `height` or the BLOCK_NUMBER of the rows.
+        """
+        with self._lock:
+            frame = self._fresh(key)
+            if frame is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return frame
+        # Query outside the lock so independent lookups can run concurrently
+        frame = fetch()
+        self.loads += 1
+        self._put(key, frame, _block_number(frame) if height is None else height)
+        return frame
+
+    def _put(self, key, frame, height=None):
+        if height is None:
+            height = _block_number(frame)
+        expires_at = None if self.is_confirmed(height) else time.time() + self.tip_ttl
+        with self._lock:
+            self._entries[key] = (expires_at, frame)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+@st.cache_resource
+def get_block_cache(_session):
+    """Process-wide BlockCache shared by every page and every user session."""
+    return BlockCache(_session)
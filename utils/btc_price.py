@@ -0,0 +1,117 @@
+"""
+Process-wide daily BTC price series.
+
+BTC_PRICE_USD is read once per data refresh (through the metric store) into
+a DATE-indexed frame, and every page slices that frame instead of querying
+BTC_DATA.DATA.BTC_PRICE_USD itself. Daily, weekly and monthly OHLC candles
+are derived from it once as well, so a candlestick chart only has to slice
+them.
+
+Derived series (differences, log returns, moving averages) are not
+precomputed here: each page derives what it plots from its own slice,
+which costs little next to keeping every variant for the whole history.
+"""
+import pandas as pd
+import streamlit as st
+
+from utils.metric_store import REFRESH_INTERVAL_SECONDS, get_metric_store
+from utils.range_cache import slice_dates
+
+BTC_PRICE_TABLE = "BTC_DATA.DATA.BTC_PRICE_USD"
+BTC_PRICE_DATE_COL = "DATE"
+BTC_PRICE_VALUE_COL = "BTC_PRICE_USD"
+BTC_PRICE_INFO = {
+    "table_name": BTC_PRICE_TABLE,
+    "date_col": BTC_PRICE_DATE_COL,
+    "numeric_cols": [BTC_PRICE_VALUE_COL]
+}
+
+
+@st.cache_resource(ttl=REFRESH_INTERVAL_SECONDS)
+def get_btc_price(_session):
+    """
+    Full daily history of BTC_PRICE_USD, indexed by DATE. Shared by all
+    sessions: treat it as read-only.
+    """
+    price = get_metric_store(_session).table(BTC_PRICE_INFO)[BTC_PRICE_VALUE_COL].dropna()
+    return pd.DataFrame({BTC_PRICE_VALUE_COL: price})
+
+
+def load_btc_price(session, start_date=None, end_date=None, columns=(BTC_PRICE_VALUE_COL,)):
+    """DATE + `columns` of the shared series within [start_date, end_date], as a fresh frame."""
+    frame = slice_dates(get_btc_price(session), start_date, end_date)
+    return frame[list(columns)].reset_index()
+
+
+######################################
+# OHLC pyramid
+######################################
+CANDLE_SPANS = ("Daily", "Weekly", "Monthly")
+
+
+def _period_start(dates, span):
+    """Vectorized start of the Daily / Weekly (Monday) / Monthly period of each date."""
+    if span == "Weekly":
+        return dates - pd.to_timedelta(dates.dayofweek, unit="D")
+    if span == "Monthly":
+        return dates - pd.to_timedelta(dates.day - 1, unit="D")
+    return dates
+
+
+def _period_end(starts, span):
+    """Last day of each period starting at `starts` (vectorized, no per-row calendar lookup)."""
+    if span == "Weekly":
+        return starts + pd.Timedelta(days=6)
+    if span == "Monthly":
+        return starts + pd.offsets.MonthEnd(0)
+    return starts
+
+
+def _ohlc(price, span):
+    """PERIOD-indexed OPEN/HIGH/LOW/CLOSE/AVG/PERIOD_END candles of a DATE-indexed price series."""
+    starts = _period_start(price.index, span)
+    candles = price.groupby(starts).agg(["first", "max", "min", "last", "mean"])
+    candles.columns = ["OPEN", "HIGH", "LOW", "CLOSE", "AVG"]
+    candles.index.name = "PERIOD"
+    candles["PERIOD_END"] = _period_end(candles.index, span)
+    return candles
+
+
+@st.cache_resource(ttl=REFRESH_INTERVAL_SECONDS)
+def get_ohlc_pyramid(_session):
+    """Daily, weekly and monthly candles over the full history, built once per data refresh."""
+    price = get_btc_price(_session)[BTC_PRICE_VALUE_COL]
+    return {span: _ohlc(price, span) for span in CANDLE_SPANS}
+
+
+def load_ohlc(session, span, start_date=None, end_date=None):
+    """
+    Candles of `span` covering [start_date, end_date], as a fresh frame with
+    columns PERIOD, OPEN, HIGH, LOW, CLOSE, AVG, PERIOD_END. Periods cut by the
+    range are rebuilt from the daily prices inside it, so edge candles match
+    an aggregation over the filtered range.
+    """
+    pyramid = get_ohlc_pyramid(session)[span]
+    start = None if start_date is None else pd.Timestamp(start_date)
+    end = None if end_date is None else pd.Timestamp(end_date)
+    first_period = None if start is None else _period_start(pd.DatetimeIndex([start]), span)[0]
+    candles = slice_dates(pyramid, first_period, end).copy()
+    if candles.empty:
+        return candles.reset_index()
+
+    price = get_btc_price(session)[BTC_PRICE_VALUE_COL]
+    edges = []
+    if start is not None and candles.index[0] < start:
+        edges.append(candles.index[0])
+    if end is not None and candles["PERIOD_END"].iloc[-1] > end:
+        edges.append(candles.index[-1])
+    for period in edges:
+        period_end = candles.at[period, "PERIOD_END"]
+        days = slice_dates(price, max(period, start or period), min(period_end, end or period_end))
+        if days.empty:
+            candles = candles.drop(index=period)
+        else:
+            candles.loc[period, ["OPEN", "HIGH", "LOW", "CLOSE", "AVG"]] = [
+                days.iloc[0], days.max(), days.min(), days.iloc[-1], days.mean()
+            ]
+    return candles.reset_index()
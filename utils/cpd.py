@@ -0,0 +1,305 @@
+"""
+Change point detection helpers.
+
+`penalty_path` implements CROPS (Changepoints for a Range Of PenaltieS,
+Haynes, Eckley & Fearnhead 2017): given a penalized segmenter and the
+unpenalized cost of a segmentation, it finds every optimal segmentation for
+all penalties in [pen_min, pen_max] with O(#segmentations) segmenter runs.
+Once the path is known, the breakpoints for any penalty are a lookup.
+
+Besides ruptures' kernel (rbf) PELT, whose cost is quadratic in the series
+length, a few bounded-latency backends are provided: PELT and binary
+segmentation on L2 / normal costs evaluated in O(1) from cumulative sums,
+and a downsample-then-refine mode. `penalty_path_within_budget` runs a
+backend under a time budget and falls back to cheaper ones when it runs out.
+"""
+import bisect
+import hashlib
+import math
+import time
+
+import numpy as np
+import ruptures as rpt
+
+# Backend key -> label shown in the UI
+CPD_BACKENDS = {
+    "rbf": "Kernel PELT (rbf, ruptures) - exact, slowest",
+    "l2": "PELT, L2 cost (mean shifts)",
+    "normal": "PELT, normal cost (mean/variance shifts)",
+    "downsample": "Downsample + refine (L2)",
+    "binseg": "Binary segmentation (L2) - fastest",
+}
+
+# Cheaper backend to fall back to when one runs out of time budget
+CPD_FALLBACKS = {
+    "rbf": "l2",
+    "l2": "downsample",
+    "normal": "downsample",
+    "downsample": "binseg",
+    "binseg": None,
+}
+
+# Target length of the coarse series in downsample mode
+DOWNSAMPLE_TARGET_POINTS = 1000
+
+# Minimum segment length for the normal (mean/variance) cost
+NORMAL_MIN_SIZE = 10
+
+
+class CPDTimeout(Exception):
+    """Raised when a change point search exceeds its time budget."""
+
+
+def series_hash(values):
+    """Stable content hash of a numeric series, used as a cache key."""
+    arr = np.ascontiguousarray(np.asarray(values, dtype=float))
+    return hashlib.sha1(arr.tobytes() + str(arr.shape).encode()).hexdigest()
+
+
+def penalty_path(segment, cost, pen_min, pen_max):
+    """
+    Optimal segmentations over a penalty range (CROPS).
+
+    segment(pen) -> breakpoints (ruptures convention: sorted, last == n)
+    cost(bkps)   -> unpenalized cost of that segmentation
+
+    Returns a list of dicts sorted by increasing penalty, one per segmentation
+    on the lower envelope, with keys pen_from, pen_to, n_changes, cost and
+    breakpoints. Segmentation i is optimal for pen_from <= pen < pen_to.
+    """
+    found = {}  # n_changes -> (cost, bkps)
+
+    def run(pen):
+        bkps = list(segment(pen))
+        m = len(bkps) - 1
+        c = float(cost(bkps))
+        if m not in found or c < found[m][0]:
+            found[m] = (c, bkps)
+        return m, c
+
+    lo = (pen_min,) + run(pen_min)
+    hi = (pen_max,) + run(pen_max)
+    intervals = [(lo, hi)]
+    while intervals:
+        (p0, m0, c0), (p1, m1, c1) = intervals.pop()
+        if m0 <= m1 + 1:
+            continue
+        # Penalty at which the two segmentations have equal penalized cost
+        p_int = (c1 - c0) / (m0 - m1)
+        if not p0 < p_int < p1:
+            continue
+        m, c = run(p_int)
+        if m != m1 and m != m0:
+            intervals.append(((p0, m0, c0), (p_int, m, c)))
+            intervals.append(((p_int, m, c), (p1, m1, c1)))
+
+    return _lower_envelope(found, pen_min, pen_max)
+
+
+def _lower_envelope(found, pen_min, pen_max):
+    """Keep the segmentations minimizing cost + pen * n_changes somewhere in range."""
+    candidates = sorted(found.items(), key=lambda kv: -kv[0])  # most change points first
+    path = []
+    pen = pen_min
+    current = min(candidates, key=lambda kv: (kv[1][0] + pen * kv[0], kv[0]))
+    while True:
+        m, (c, bkps) = current
+        # Next crossover: the first line with fewer change points that becomes
+        # cheaper (on ties, the one with the fewest change points wins)
+        next_key, next_entry = (pen_max, -1), None
+        for entry in candidates:
+            m2, (c2, _) = entry
+            if m2 >= m:
+                continue
+            key = ((c2 - c) / (m - m2), m2)
+            if pen < key[0] and key < next_key:
+                next_key, next_entry = key, entry
+        next_pen = next_key[0]
+        path.append({
+            "pen_from": pen,
+            "pen_to": next_pen,
+            "n_changes": m,
+            "cost": c,
+            "breakpoints": bkps,
+        })
+        if next_entry is None:
+            break
+        pen, current = next_pen, next_entry
+    return path
+
+
+def breakpoints_for_penalty(path, pen):
+    """Breakpoints of the optimal segmentation for `pen`, looked up on a penalty path."""
+    starts = [entry["pen_from"] for entry in path]
+    i = max(bisect.bisect_right(starts, pen) - 1, 0)
+    return path[i]["breakpoints"]
+
+
+######################################
+# Cumulative-sum costs
+######################################
+class CumsumCost:
+    """
+    Segment costs for a 1-D signal in O(1) per segment from prefix sums.
+
+    model="l2":     sum of squared deviations from the segment mean
+    model="normal": n * log(variance), i.e. a Gaussian mean/variance change
+    Segments follow the ruptures convention: [start, end) in sample indices.
+    """
+
+    def __init__(self, signal, model="l2"):
+        signal = np.asarray(signal, dtype=float)
+        self.model = model
+        self.n = len(signal)
+        self.s1 = np.concatenate([[0.0], np.cumsum(signal)])
+        self.s2 = np.concatenate([[0.0], np.cumsum(signal * signal)])
+
+    def __call__(self, starts, ends):
+        """Vectorized cost of segments [starts, ends) (arrays broadcast)."""
+        length = ends - starts
+        s1 = self.s1[ends] - self.s1[starts]
+        s2 = self.s2[ends] - self.s2[starts]
+        sse = np.maximum(s2 - s1 * s1 / length, 0.0)
+        if self.model == "normal":
+            # Variance floor keeps near-constant short segments from dominating
+            return length * np.log(np.maximum(sse / length, 1e-4))
+        return sse
+
+    def sum_of_costs(self, bkps):
+        edges = np.asarray([0] + list(bkps))
+        return float(np.sum(self(edges[:-1], edges[1:])))
+
+
+def _standardize(signal):
+    signal = np.asarray(signal, dtype=float)
+    std = signal.std()
+    return (signal - signal.mean()) / (std if std > 0 else 1.0)
+
+
+def _check(deadline):
+    if deadline is not None and time.perf_counter() > deadline:
+        raise CPDTimeout()
+
+
+def pelt(cost, pen, min_size=2, deadline=None):
+    """Exact penalized segmentation (Killick et al. 2012) with vectorized candidate scans."""
+    n = cost.n
+    F = np.full(n + 1, np.inf)
+    F[0] = -pen
+    last = np.zeros(n + 1, dtype=int)
+    candidates = np.array([0])
+    for t in range(min_size, n + 1):
+        if t % 256 == 0:
+            _check(deadline)
+        usable = t - candidates >= min_size
+        starts = candidates[usable]
+        totals = F[starts] + cost(starts, t) + pen
+        best = np.argmin(totals)
+        F[t] = totals[best]
+        last[t] = starts[best]
+        # Pruning: drop starts that can never be optimal again
+        keep = np.concatenate([candidates[~usable], starts[totals - pen <= F[t]]])
+        candidates = np.append(keep, t)
+
+    bkps = [n]
+    t = n
+    while last[t] > 0:
+        t = int(last[t])
+        bkps.append(t)
+    return sorted(bkps)
+
+
+def binseg(cost, pen, min_size=2, deadline=None):
+    """Greedy binary segmentation: split while the best split gains more than `pen`."""
+    n = cost.n
+    bkps = [n]
+    stack = [(0, n)]
+    while stack:
+        _check(deadline)
+        s, e = stack.pop()
+        if e - s < 2 * min_size:
+            continue
+        splits = np.arange(s + min_size, e - min_size + 1)
+        gains = cost(s, e) - cost(s, splits) - cost(splits, e)
+        best = np.argmax(gains)
+        if gains[best] > pen:
+            t = int(splits[best])
+            bkps.append(t)
+            stack += [(s, t), (t, e)]
+    return sorted(bkps)
+
+
+def downsample_refine(signal, pen, min_size=2, deadline=None, target_points=DOWNSAMPLE_TARGET_POINTS):
+    """
+    PELT on block means of the signal, then each breakpoint is moved to the
+    best position within one block of its coarse location on the full series.
+    """
+    signal = np.asarray(signal, dtype=float)
+    n = len(signal)
+    factor = max(1, math.ceil(n / target_points))
+    full_cost = CumsumCost(signal)
+    if factor == 1:
+        return pelt(full_cost, pen, min_size, deadline)
+
+    usable = n - n % factor
+    coarse = signal[:usable].reshape(-1, factor).mean(axis=1)
+    # A block mean carries ~1/factor of the block's squared deviations
+    coarse_bkps = pelt(CumsumCost(coarse), pen / factor, 1, deadline)
+
+    bkps = [min(b * factor, n) for b in coarse_bkps[:-1]] + [n]
+    for i in range(len(bkps) - 1):
+        _check(deadline)
+        prev_b = bkps[i - 1] if i > 0 else 0
+        next_b = bkps[i + 1]
+        lo = max(prev_b + min_size, bkps[i] - factor)
+        hi = min(next_b - min_size, bkps[i] + factor)
+        if lo > hi:
+            continue
+        positions = np.arange(lo, hi + 1)
+        local = full_cost(prev_b, positions) + full_cost(positions, next_b)
+        bkps[i] = int(positions[np.argmin(local)])
+    return sorted(set(bkps))
+
+
+def segmenter(signal, backend, deadline=None):
+    """(segment(pen) -> bkps, cost(bkps) -> float) for a backend key of CPD_BACKENDS."""
+    if backend == "rbf":
+        algo = rpt.Pelt(model="rbf").fit(np.asarray(signal))
+
+        def segment(pen):
+            # ruptures cannot be interrupted, so the budget is checked between runs
+            _check(deadline)
+            return algo.predict(pen=pen)
+        return segment, algo.cost.sum_of_costs
+
+    z = _standardize(signal)
+    if backend == "downsample":
+        cost = CumsumCost(z)
+        return (lambda pen: downsample_refine(z, pen, deadline=deadline)), cost.sum_of_costs
+
+    if backend == "normal":
+        # A variance needs more than two points to be meaningful
+        cost = CumsumCost(z, model="normal")
+        return (lambda pen: pelt(cost, pen, min_size=NORMAL_MIN_SIZE, deadline=deadline)), cost.sum_of_costs
+
+    cost = CumsumCost(z)
+    search = binseg if backend == "binseg" else pelt
+    return (lambda pen: search(cost, pen, deadline=deadline)), cost.sum_of_costs
+
+
+def penalty_path_within_budget(signal, backend, pen_min, pen_max, time_budget):
+    """
+    Penalty path for `backend`, falling back along CPD_FALLBACKS whenever the
+    time budget (seconds, shared by all attempts) runs out. The last backend
+    in the chain always runs to completion.
+
+    Returns (path, backend_actually_used).
+    """
+    deadline = time.perf_counter() + time_budget
+    while True:
+        fallback = CPD_FALLBACKS[backend]
+        try:
+            segment, cost = segmenter(signal, backend, deadline if fallback else None)
+            return penalty_path(segment, cost, pen_min, pen_max), backend
+        except CPDTimeout:
+            backend = fallback
@@ -0,0 +1,80 @@
+"""
+Request-scoped and cross-rerun memoization for per-feature loaders.
+
+A page may ask for the same (feature, start, end) several times in one
+rerun and again on the next rerun. FeatureMemo canonicalizes the key, serves
+repeats from memory and counts how many loads it saved.
+"""
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# Cross-rerun entries are dropped after this long so daily refreshes show up.
+FEATURE_MEMO_TTL_SECONDS = 60 * 60
+FEATURE_MEMO_MAX_ENTRIES = 128
+
+
+def canonical_key(feature, start_date, end_date):
+    """(feature, 'YYYY-MM-DD' | None, 'YYYY-MM-DD' | None) for any date-like bounds."""
+    def _day(value):
+        return None if value is None else pd.Timestamp(value).strftime("%Y-%m-%d")
+    return feature.strip(), _day(start_date), _day(end_date)
+
+
+class FeatureMemo:
+    """Two-level memo: one dict per rerun plus a bounded, TTL-bound LRU across reruns."""
+
+    def __init__(self, ttl=FEATURE_MEMO_TTL_SECONDS, max_entries=FEATURE_MEMO_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._run = {}
+        self._shared = OrderedDict()  # key -> (stored_at, frame)
+        self.run_hits = 0
+        self.run_loads = 0
+        self.total_hits = 0
+        self.total_loads = 0
+
+    def begin_run(self):
+        """Start a new rerun: reset the request-scoped layer and the per-run counters."""
+        self._run = {}
+        self.run_hits = 0
+        self.run_loads = 0
+
+    def get(self, feature, start_date, end_date, loader):
+        """
+        Return a private copy of loader(feature, start_date, end_date),
+        calling the loader only if neither layer holds the canonical key.
+        """
+        key = canonical_key(feature, start_date, end_date)
+        frame = self._run.get(key)
+        if frame is None:
+            frame = self._lookup_shared(key)
+            if frame is None:
+                frame = loader(feature, start_date, end_date)
+                self._run[key] = frame
+                self._remember(key, frame)
+                self.run_loads += 1
+                self.total_loads += 1
+                return frame.copy()
+            self._run[key] = frame
+        self.run_hits += 1
+        self.total_hits += 1
+        # Callers transform the frame in place (diff, shift, dropna)
+        return frame.copy()
+
+    def _lookup_shared(self, key):
+        cached = self._shared.get(key)
+        if cached is None:
+            return None
+        stored_at, frame = cached
+        if time.time() - stored_at > self.ttl:
+            del self._shared[key]
+            return None
+        self._shared.move_to_end(key)
+        return frame
+
+    def _remember(self, key, frame):
+        self._shared[key] = (time.time(), frame)
+        while len(self._shared) > self.max_entries:
+            self._shared.popitem(last=False)
@@ -0,0 +1,347 @@
+"""
+HODL waves computed from UTXO creation and spend events.
+
+UTXO_LIFECYCLE is reduced to aggregated events (CREATED_DAY, SPENT_DAY,
+BTC_VALUE summed over the UTXOs sharing both days; SPENT_DAY is NaT while
+unspent), kept as a Parquet extract next to the metric store. HodlEngine
+replays those events one day at a time with array-backed running totals:
+
+- alive[c]:   BTC created on day c and still unspent
+- totals[b]:  BTC whose age falls in age bucket b
+
+Moving to day D only shifts alive[D - edge] across each bucket edge, adds
+the day's creations to the youngest bucket and removes the day's spends
+from the bucket of their age, so appending a day costs O(#buckets +
+#events of that day) and never revisits history. Custom age buckets are
+just another list of edges.
+"""
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from utils.metric_store import METRIC_STORE_DIR
+from utils.query import Where, day, run, sql
+
+UTXO_TABLE = "BTC_DATA.DATA.UTXO_LIFECYCLE"
+UTXO_EVENTS_PATH = os.path.join(METRIC_STORE_DIR, "UTXO_LIFECYCLE_EVENTS.parquet")
+# Parquet schema metadata key of the last complete day in the extract
+_THROUGH_KEY = b"utxo_events_through"
+
+# Lower age bound (days) of each default bucket; the last one is open-ended
+DEFAULT_AGE_EDGES = (0, 1, 7, 30, 90, 180, 365, 730, 1095, 1825, 2555, 3650)
+
+_EDGE_UNITS = {"d": 1, "w": 7, "m": 30, "y": 365}
+_EDGE_PATTERN = re.compile(r"(\d+)\s*([dwmy])")
+
+
+def _age_label(days):
+    for unit, size in (("y", 365), ("m", 30), ("w", 7)):
+        if days >= size and days % size == 0:
+            return f"{days // size}{unit}"
+    return f"{days}d"
+
+
+def age_bucket_labels(edges):
+    """Labels such as "<1d", "1d-1w", ..., "10y+" for a list of bucket edges (days)."""
+    labels = []
+    for i, lo in enumerate(edges):
+        if i + 1 == len(edges):
+            labels.append(f"{_age_label(lo)}+")
+        elif lo == 0:
+            labels.append(f"<{_age_label(edges[i + 1])}")
+        else:
+            labels.append(f"{_age_label(lo)}-{_age_label(edges[i + 1])}")
+    return labels
+
+
+def parse_age_edges(text):
+    """
+    Bucket edges (days) from a comma-separated list of ages such as
+    "1d, 1w, 1m, 6m, 1y, 5y" (a month is 30 days, a year 365). Edge 0 is
+    always included; unrecognized entries are ignored.
+    """
+    edges = {0}
+    for number, unit in _EDGE_PATTERN.findall(text.lower()):
+        edges.add(int(number) * _EDGE_UNITS[unit])
+    return tuple(sorted(edges))
+
+
+class HodlEngine:
+    """Incremental age-bucket supply from daily UTXO creation / spend events."""
+
+    def __init__(self, edges=DEFAULT_AGE_EDGES):
+        self.edges = np.asarray(sorted(set(edges)), dtype=np.int64)
+        if self.edges[0] != 0:
+            self.edges = np.concatenate([[0], self.edges])
+        self.labels = age_bucket_labels(self.edges.tolist())
+        self.origin = None      # Timestamp of day 0
+        self.last_day = -1      # last processed day offset
+        self.alive = np.zeros(0)
+        self.totals = np.zeros(len(self.edges))
+        self._history = []      # one totals snapshot per processed day
+
+    ######################################
+    # Public API
+    ######################################
+    @property
+    def last_date(self):
+        return None if self.origin is None else self.origin + pd.Timedelta(days=self.last_day)
+
+    def append(self, events, through_date):
+        """
+        Process every day after last_date up to `through_date` (inclusive).
+
+        `events` holds CREATED_DAY, SPENT_DAY and BTC_VALUE rows; only
+        creations and spends falling on the processed days are used, so
+        the rows may be a full extract or just the recent changes.
+        """
+        # Already up to date: skip the copy of the extract below
+        if self.origin is not None and (pd.Timestamp(through_date) - self.origin).days <= self.last_day:
+            return
+        events = events.dropna(subset=["CREATED_DAY"])
+        if self.origin is None:
+            if events.empty:
+                return
+            self.origin = pd.Timestamp(events["CREATED_DAY"].min())
+        start = self.last_day + 1
+        stop = (pd.Timestamp(through_date) - self.origin).days
+        if stop < start:
+            return
+
+        created = self._offsets(events["CREATED_DAY"])
+        spent = self._offsets(events["SPENT_DAY"])
+        value = events["BTC_VALUE"].to_numpy(dtype=float)
+
+        # Creations per day in the window
+        new = (created >= start) & (created <= stop)
+        creations = np.bincount(created[new] - start, weights=value[new], minlength=stop - start + 1)
+
+        # Spends in the window, grouped by day
+        gone = (spent >= start) & (spent <= stop)
+        order = np.argsort(spent[gone], kind="stable")
+        spend_day = spent[gone][order]
+        spend_created = created[gone][order]
+        spend_value = value[gone][order]
+        bounds = np.searchsorted(spend_day, np.arange(start, stop + 2))
+
+        if len(self.alive) <= stop:
+            self.alive = np.concatenate([self.alive, np.zeros(stop + 1 - len(self.alive))])
+
+        aging_edges = self.edges[1:]
+        for day in range(start, stop + 1):
+            # Coins reaching an edge age move up one bucket
+            crossing = day - aging_edges
+            valid = crossing >= 0
+            moving = np.zeros(len(aging_edges))
+            moving[valid] = self.alive[crossing[valid]]
+            self.totals[1:] += moving
+            self.totals[:-1] -= moving
+
+            self.alive[day] += creations[day - start]
+            self.totals[0] += creations[day - start]
+
+            lo, hi = bounds[day - start], bounds[day - start + 1]
+            if hi > lo:
+                c = spend_created[lo:hi]
+                v = spend_value[lo:hi]
+                np.subtract.at(self.alive, c, v)
+                buckets = np.searchsorted(self.edges, day - c, side="right") - 1
+                self.totals -= np.bincount(buckets, weights=v, minlength=len(self.edges))
+
+            self._history.append(self.totals.copy())
+        self.last_day = stop
+
+    def supply(self):
+        """DATE x age bucket matrix of BTC held (float64)."""
+        if not self._history:
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="DATE"), columns=self.labels, dtype=float)
+        index = pd.date_range(self.origin, periods=len(self._history), name="DATE")
+        return pd.DataFrame(np.vstack(self._history), index=index, columns=self.labels)
+
+    def shares(self):
+        """
+        DATE x AGE_BUCKET matrix of PERCENT_SUPPLY (float32), laid out like
+        utils.hodl_waves.load_hodl_matrix.
+        """
+        # Float round-off can leave tiny negative totals in emptied buckets
+        supply = self.supply().clip(lower=0)
+        total = supply.sum(axis=1).replace(0, np.nan)
+        shares = supply.div(total, axis=0).mul(100).astype(np.float32)
+        shares.columns = pd.CategoricalIndex(self.labels, categories=self.labels, ordered=True, name="AGE_BUCKET")
+        return shares
+
+    ######################################
+    # Internal helpers
+    ######################################
+    def _offsets(self, days):
+        """Day offsets from origin (-1 for NaT)."""
+        offsets = (pd.to_datetime(days) - self.origin).dt.days
+        return offsets.fillna(-1).to_numpy(dtype=np.int64)
+
+
+######################################
+# Events extract
+######################################
+def fetch_utxo_events(session, since=None):
+    """
+    Aggregated (CREATED_DAY, SPENT_DAY, BTC_VALUE) events of UTXO_LIFECYCLE.
+    With `since`, only rows created or spent after that date.
+    """
+    where = Where()
+    if since is not None:
+        after = day(pd.Timestamp(since) + pd.Timedelta(days=1))
+        where.add("(CREATED_TIMESTAMP >= ? OR SPENT_TIMESTAMP >= ?)", after, after)
+    query = sql(f"""
+        SELECT
+            CAST(CREATED_TIMESTAMP AS DATE) AS CREATED_DAY,
+            CAST(SPENT_TIMESTAMP AS DATE) AS SPENT_DAY,
+            SUM(BTC_VALUE) AS BTC_VALUE
+        FROM {UTXO_TABLE}
+        {where}
+        GROUP BY 1, 2
+    """, *where.params)
+    df = run(session, query)
+    df["CREATED_DAY"] = pd.to_datetime(df["CREATED_DAY"])
+    df["SPENT_DAY"] = pd.to_datetime(df["SPENT_DAY"])
+    df["BTC_VALUE"] = df["BTC_VALUE"].astype(float)
+    return df
+
+
+def truncate_utxo_events(events, through):
+    """Events as of the end of `through`: later creations dropped, later spends not yet spent."""
+    through = pd.Timestamp(through)
+    events = events[events["CREATED_DAY"] <= through].copy()
+    events.loc[events["SPENT_DAY"] > through, "SPENT_DAY"] = pd.NaT
+    return (
+        events.groupby(["CREATED_DAY", "SPENT_DAY"], dropna=False, as_index=False)["BTC_VALUE"].sum()
+        .sort_values(["CREATED_DAY", "SPENT_DAY"], ignore_index=True)
+    )
+
+
+def merge_utxo_events(extract, recent, since):
+    """
+    Fold `recent` = fetch_utxo_events(since=since) into an extract taken
+    through `since`: coins created earlier and spent after it move from
+    their (CREATED_DAY, NaT) row to a (CREATED_DAY, SPENT_DAY) row.
+    """
+    since = pd.Timestamp(since)
+    old_spent = recent[recent["CREATED_DAY"] <= since]
+    released = old_spent.groupby("CREATED_DAY")["BTC_VALUE"].sum()
+    unspent = extract["SPENT_DAY"].isna() & extract["CREATED_DAY"].isin(released.index)
+    extract = extract.copy()
+    extract.loc[unspent, "BTC_VALUE"] -= extract.loc[unspent, "CREATED_DAY"].map(released).to_numpy()
+    merged = pd.concat([extract, recent], ignore_index=True)
+    return (
+        merged.groupby(["CREATED_DAY", "SPENT_DAY"], dropna=False, as_index=False)["BTC_VALUE"].sum()
+        .sort_values(["CREATED_DAY", "SPENT_DAY"], ignore_index=True)
+    )
+
+
+def load_utxo_events(session, path=UTXO_EVENTS_PATH):
+    """
+    The Parquet events extract (pulled from Snowflake on first use) and the
+    last complete day it covers. An extract without a readable watermark is
+    pulled again rather than guessed.
+    """
+    if os.path.exists(path):
+        table = pq.read_table(path)
+        watermark = (table.schema.metadata or {}).get(_THROUGH_KEY)
+        if watermark is not None:
+            return table.to_pandas(), pd.Timestamp(watermark.decode())
+    through = pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+    events = truncate_utxo_events(fetch_utxo_events(session), through)
+    _write_events(events, through, path)
+    return events, through
+
+
+def _write_events(events, through, path):
+    """Write the extract with its `through` watermark in the Parquet schema metadata."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(events, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), _THROUGH_KEY: f"{pd.Timestamp(through):%Y-%m-%d}".encode()}
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+    os.replace(tmp_path, path)
+
+
+class UtxoEvents:
+    """The events extract, kept current with the warehouse and shared by every HodlWaves."""
+
+    def __init__(self, session, path=UTXO_EVENTS_PATH):
+        self.session = session
+        self.path = path
+        self._lock = threading.Lock()
+        self.events, self.through = load_utxo_events(session, path)
+
+    def refresh(self):
+        """Fold in the complete days since `through` and rewrite the extract."""
+        with self._lock:
+            yesterday = pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+            if yesterday <= self.through:
+                return
+            recent = truncate_utxo_events(fetch_utxo_events(self.session, since=self.through), yesterday)
+            self.events = merge_utxo_events(self.events, recent, self.through)
+            self.through = yesterday
+            _write_events(self.events, self.through, self.path)
+
+    def snapshot(self):
+        """(events, through) as of the last refresh; the frame is shared, treat it as read-only."""
+        with self._lock:
+            return self.events, self.through
+
+
+class HodlWaves:
+    """A HodlEngine kept current with the shared events extract."""
+
+    def __init__(self, source, edges=DEFAULT_AGE_EDGES):
+        self.source = source
+        self._lock = threading.Lock()
+        self.engine = HodlEngine(edges)
+        self.engine.append(*source.snapshot())
+
+    def refresh(self):
+        """Append the complete days since the last refresh; history is not recomputed."""
+        self.source.refresh()
+        events, through = self.source.snapshot()
+        with self._lock:
+            # Only creations / spends on the appended days are read from the extract
+            self.engine.append(events, through)
+
+    def shares(self):
+        with self._lock:
+            return self.engine.shares()
+
+
+# Bucket layouts kept replayed at once (each holds one supply row per day)
+HODL_WAVES_MAX_ENTRIES = 8
+
+
+def normalize_age_edges(edges):
+    """Sorted, de-duplicated integer edges starting at 0, as HodlEngine uses them."""
+    return tuple(sorted({0, *(int(e) for e in edges)}))
+
+
+@st.cache_resource
+def get_utxo_events(_session):
+    """Process-wide UtxoEvents: the extract is read (or pulled) once per process."""
+    return UtxoEvents(_session)
+
+
+@st.cache_resource(max_entries=HODL_WAVES_MAX_ENTRIES)
+def _get_hodl_waves(_session, edges):
+    return HodlWaves(get_utxo_events(_session), edges)
+
+
+def get_hodl_waves(session, edges=DEFAULT_AGE_EDGES):
+    """
+    Process-wide HodlWaves per set of bucket edges (normalized, so "1w, 1d"
+    and "1d, 1w" share one), replayed once from the shared extract; callers
+    refresh() it to append the days completed since.
+    """
+    return _get_hodl_waves(session, normalize_age_edges(edges))
@@ -0,0 +1,77 @@
+"""
+HODL waves data access.
+
+The HODL_Waves table is long (DATE, AGE_BUCKET, PERCENT_SUPPLY). Pages read
+it as a cached, DATE-indexed wide matrix with one float32 column per age
+bucket, the date range and bucket selection pushed down into the query.
+Bucket labels are an ordered categorical, youngest to oldest.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.metric_store import REFRESH_INTERVAL_SECONDS
+from utils.query import Where, run, sql
+
+HODL_TABLE = "HODL_Waves"
+
+# Age units found in bucket labels, in days
+_AGE_UNITS = {"h": 1 / 24, "d": 1, "w": 7, "m": 30.4375, "y": 365.25}
+_AGE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*([hdwmy])", re.IGNORECASE)
+
+
+def bucket_age_days(label):
+    """
+    Lower age bound (days) of a bucket label such as "1d-1w", "<1d" or
+    "10y+": the first number/unit pair, 0 for "<..." labels. Labels without
+    a recognizable age sort last (inf).
+    """
+    match = _AGE_PATTERN.search(str(label))
+    if match is None:
+        return np.inf
+    if str(label).lstrip().startswith("<"):
+        return 0.0
+    return float(match.group(1)) * _AGE_UNITS[match.group(2).lower()]
+
+
+def order_buckets(labels):
+    """Bucket labels sorted youngest to oldest (ties alphabetically)."""
+    return sorted(labels, key=lambda label: (bucket_age_days(label), str(label)))
+
+
+@st.cache_data(ttl=REFRESH_INTERVAL_SECONDS)
+def fetch_age_buckets(_session):
+    """All AGE_BUCKET labels of the HODL table, youngest to oldest."""
+    df = run(_session, sql(f"SELECT DISTINCT AGE_BUCKET FROM {HODL_TABLE}"))
+    return order_buckets(df["AGE_BUCKET"].dropna().tolist())
+
+
+@st.cache_data(ttl=REFRESH_INTERVAL_SECONDS)
+def load_hodl_matrix(_session, start_date, buckets):
+    """
+    DATE x AGE_BUCKET matrix of PERCENT_SUPPLY (float32) for the `buckets`
+    (a tuple of labels) from `start_date` up to yesterday. Columns follow
+    the order of `buckets` as an ordered CategoricalIndex.
+    """
+    columns = pd.CategoricalIndex(buckets, categories=list(buckets), ordered=True, name="AGE_BUCKET")
+    if not buckets:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name="DATE"), columns=columns, dtype=np.float32)
+
+    where = (
+        Where()
+        .date_range("DATE", start_date)
+        .add("DATE < CURRENT_DATE")
+        .is_in("AGE_BUCKET", buckets)
+    )
+    query = sql(f"""
+        SELECT DATE, AGE_BUCKET, PERCENT_SUPPLY
+        FROM {HODL_TABLE}
+        {where}
+    """, *where.params)
+    df = run(_session, query)
+    df["DATE"] = pd.to_datetime(df["DATE"])
+    df["AGE_BUCKET"] = pd.Categorical(df["AGE_BUCKET"], categories=columns.categories, ordered=True)
+    matrix = df.groupby(["DATE", "AGE_BUCKET"], observed=True)["PERCENT_SUPPLY"].sum().unstack()
+    return matrix.reindex(columns=columns).sort_index().astype(np.float32)
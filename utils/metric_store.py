@@ -0,0 +1,371 @@
+"""
+Local columnar cache for the BTC_DATA.DATA metric tables.
+
+Every table referenced by a page's TABLE_DICT is kept as one Parquet file
+under METRIC_STORE_DIR. The first read pulls the table from Snowflake; later
+reads only fetch rows at or after the cached MAX(DATE), and only once per
+refresh interval, so a typical rerun is a local read instead of a warehouse
+round trip.
+
+Raw event tables (one row per event rather than per day) declare an
+"aggregate" entry in their table_info, mapping each output column to a SQL
+aggregate, e.g. {"BTC_VALUE": "SUM(BTC_VALUE)", "UTXO_COUNT": "COUNT(*)"};
+they are grouped by day in the warehouse. Long tables (one row per day and
+category) declare a "pivot" entry, {"column": <category column>, "value":
+<value column>}, and are pivoted server-side into one float64 column per
+category listed in numeric_cols. Results are streamed back in batches, and
+a pull of more than the row budget is refused.
+"""
+import os
+import re
+import threading
+import time
+from contextlib import ExitStack
+
+import pandas as pd
+import streamlit as st
+
+from utils.query import Where, literal, run_batches, sql
+from utils.range_cache import slice_dates
+
+METRIC_STORE_DIR = os.environ.get(
+    "METRIC_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "metric_store"),
+)
+
+# The source tables are rebuilt once a day, so checking hourly is plenty.
+REFRESH_INTERVAL_SECONDS = 60 * 60
+
+# Most rows a single fetch may return; daily metric tables are far below it.
+ROW_BUDGET = int(os.environ.get("METRIC_STORE_ROW_BUDGET", 2_000_000))
+
+
+class RowBudgetExceeded(RuntimeError):
+    """Raised when a fetch would return more rows than the store's row budget."""
+
+
+class MetricStore:
+    """Parquet-backed, incrementally refreshed copy of the metric tables."""
+
+    def __init__(self, session, cache_dir=METRIC_STORE_DIR, refresh_interval=REFRESH_INTERVAL_SECONDS,
+                 row_budget=ROW_BUDGET):
+        self.session = session
+        self.cache_dir = cache_dir
+        self.refresh_interval = refresh_interval
+        self.row_budget = row_budget
+        self._frames = {}      # _key(table_info) -> DATE-indexed DataFrame of cached columns
+        self._checked_at = {}  # _key(table_info) -> wall-clock time of the last refresh
+        self._key_locks = {}
+        self._lock = threading.Lock()  # guards the dicts only, never held during a fetch
+        os.makedirs(cache_dir, exist_ok=True)
+
+    ######################################
+    # Public API
+    ######################################
+    def table(self, table_info, columns=None):
+        """
+        Return the full cached history of `columns` (default: all numeric_cols)
+        for the table described by `table_info`, indexed by a sorted DATE
+        DatetimeIndex and refreshed if stale. The returned frame is shared;
+        callers must not modify it in place.
+        """
+        columns = list(columns or table_info["numeric_cols"])
+        name = self._key(table_info)
+        # One lock per table: a slow pull only holds up readers of that table
+        with self._key_lock(name):
+            frame = self._cached(name)
+            if self._needs_full_fetch(frame, columns):
+                # Cold cache or new columns requested: pull the union once.
+                frame = self._fetch(table_info, self._wanted_columns(frame, columns))
+                self._store(name, frame)
+            elif self._is_stale(name):
+                frame = self._refresh(table_info, frame)
+        return frame[columns]
+
+    def load(self, table_info, columns=None, start_date=None, end_date=None):
+        """
+        Return DATE + `columns` restricted to [start_date, end_date] (either
+        bound may be None), as a fresh frame the caller is free to mutate.
+        """
+        frame = self.table(table_info, columns)
+        return slice_dates(frame, start_date, end_date).reset_index()
+
+    def load_wide(self, table_specs, start_date=None, end_date=None):
+        """
+        Return one DATE-aligned wide frame for several tables.
+
+        `table_specs` maps a label to (table_info, columns); output columns
+        are named f"{label}:{col}". Every table that is cold or stale is
+        fetched in a single statement (a date spine outer-joined to each
+        table), the rest is read locally, and the result is assembled with
+        one concat on the DATE index instead of repeated merges.
+        """
+        names = sorted({self._key(table_info) for table_info, _ in table_specs.values()})
+        with ExitStack() as stack:
+            # Every table's lock, always taken in name order so two calls cannot deadlock
+            for name in names:
+                stack.enter_context(self._key_lock(name))
+            pending = {}  # table_name -> (table_info, columns, since)
+            for table_info, columns in table_specs.values():
+                name = self._key(table_info)
+                frame = self._cached(name)
+                if name in pending:
+                    info, cols, since = pending[name]
+                    if self._needs_full_fetch(frame, columns):
+                        # Columns the cache lacks need their whole history
+                        since = None
+                    pending[name] = (info, cols + [c for c in columns if c not in cols], since)
+                elif self._needs_full_fetch(frame, columns):
+                    pending[name] = (table_info, self._wanted_columns(frame, columns), None)
+                elif self._is_stale(name):
+                    since = frame.index[-1] if len(frame) else None
+                    pending[name] = (table_info, list(frame.columns), since)
+
+            if pending:
+                for name, delta in self._fetch_many(list(pending.values())).items():
+                    since = pending[name][2]
+                    if since is None:
+                        self._store(name, delta)
+                    else:
+                        frame = self._cached(name)
+                        keep = frame.iloc[:frame.index.searchsorted(since, side="left")]
+                        self._store(name, pd.concat([keep, delta]))
+
+            parts = []
+            for label, (table_info, columns) in table_specs.items():
+                part = slice_dates(self._cached(self._key(table_info))[list(columns)], start_date, end_date)
+                if not part.index.is_unique:
+                    # concat(axis=1) cannot align duplicate dates: keep one row per day
+                    part = part[~part.index.duplicated(keep="last")]
+                parts.append(part.rename(columns={col: f"{label}:{col}" for col in columns}))
+
+        wide = pd.concat(parts, axis=1, join="outer").sort_index()
+        wide.index.name = "DATE"
+        return wide.reset_index()
+
+    @staticmethod
+    def _key(table_info):
+        """Cache key of a table: its name, case-normalized like the Parquet file name."""
+        return table_info["table_name"].strip().upper()
+
+    def _key_lock(self, name):
+        with self._lock:
+            return self._key_locks.setdefault(name, threading.Lock())
+
+    def _cached(self, name):
+        """Cached frame of a table, None if it was never fetched (an empty frame is a fetched, empty table)."""
+        with self._lock:
+            frame = self._frames.get(name)
+        if frame is None:
+            frame = self._read(name)
+            if frame is not None:
+                with self._lock:
+                    self._frames[name] = frame
+        return frame
+
+    @staticmethod
+    def _needs_full_fetch(frame, columns):
+        if frame is None or any(c not in frame.columns for c in columns):
+            return True
+        # Pivots cached as float32 lost precision on large counts: pull them again
+        return bool((frame.dtypes == "float32").any())
+
+    @staticmethod
+    def _wanted_columns(frame, columns):
+        cached_cols = [] if frame is None else list(frame.columns)
+        return cached_cols + [c for c in columns if c not in cached_cols]
+
+    ######################################
+    # Warehouse access
+    ######################################
+    @staticmethod
+    def _select_list(table_info, columns):
+        """SELECT items for `columns`: plain columns, or their aggregate for event tables."""
+        aggregate = table_info.get("aggregate")
+        if not aggregate:
+            return ", ".join(columns)
+        return ", ".join(f"{aggregate[col]} AS {col}" for col in columns)
+
+    @staticmethod
+    def _group_by(table_info):
+        return "GROUP BY 1" if table_info.get("aggregate") else ""
+
+    def _fetch(self, table_info, columns, since=None):
+        if table_info.get("pivot"):
+            return self._fetch_pivot(table_info, columns, since)
+
+        date_col = table_info["date_col"]
+        where = Where().date_range(date_col, since)
+        query = sql(f"""
+            SELECT
+                CAST({date_col} AS DATE) AS DATE,
+                {self._select_list(table_info, columns)}
+            FROM {table_info['table_name']}
+            {where}
+            {self._group_by(table_info)}
+            ORDER BY DATE
+        """, *where.params)
+
+        df = self._stream(query, ["DATE"] + list(columns), table_info["table_name"])
+        df["DATE"] = pd.to_datetime(df["DATE"])
+        return df.set_index("DATE")
+
+    def _fetch_pivot(self, table_info, columns, since=None):
+        """One row per day, one float64 column per category in `columns` (PIVOT in the warehouse)."""
+        date_col = table_info["date_col"]
+        category = table_info["pivot"]["column"]
+        value = table_info["pivot"]["value"]
+        # PIVOT needs literal categories; they are not valid identifiers either,
+        # so the output columns are aliased C0..Cn and renamed locally
+        categories = ", ".join(literal(c) for c in columns)
+        aliases = [f"C{i}" for i in range(len(columns))]
+        where = Where().date_range(date_col, since)
+        query = sql(f"""
+            SELECT *
+            FROM (
+                SELECT CAST({date_col} AS DATE) AS DATE, {category}, {value}
+                FROM {table_info['table_name']}
+                {where}
+            )
+            PIVOT (SUM({value}) FOR {category} IN ({categories})) AS P (DATE, {", ".join(aliases)})
+            ORDER BY DATE
+        """, *where.params)
+
+        df = self._stream(query, ["DATE"] + aliases, table_info["table_name"])
+        df["DATE"] = pd.to_datetime(df["DATE"])
+        df = df.set_index("DATE").set_axis(list(columns), axis=1)
+        # float64, not float32: counts above 2**24 must stay exact
+        return df.astype("float64")
+
+    def _stream(self, query, columns, source):
+        """
+        Run `query` and read its result batch by batch, refusing it as soon
+        as more than row_budget rows have arrived.
+        """
+        batches = []
+        n_rows = 0
+        for batch in run_batches(self.session, query):
+            n_rows += len(batch)
+            if n_rows > self.row_budget:
+                raise RowBudgetExceeded(
+                    f"{source}: more than {self.row_budget:,} rows requested. "
+                    "Declare an \"aggregate\" in its table_info to group it by day in the warehouse."
+                )
+            batches.append(batch)
+        if not batches:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(batches, ignore_index=True)
+
+    def _fetch_many(self, requests):
+        """
+        Fetch several tables in one round trip.
+
+        `requests` is a list of (table_info, columns, since) tuples. Returns a
+        dict table_name -> DATE-indexed frame holding only the rows that table
+        actually has (the spine rows it was outer-joined onto are dropped).
+        """
+        # Pivoted tables have their own query shape and are fetched on their own
+        result = {
+            self._key(table_info): self._fetch(table_info, columns, since)
+            for table_info, columns, since in requests
+            if table_info.get("pivot")
+        }
+        requests = [r for r in requests if not r[0].get("pivot")]
+        if len(requests) <= 1:
+            for table_info, columns, since in requests:
+                result[self._key(table_info)] = self._fetch(table_info, columns, since)
+            return result
+
+        ctes = []
+        params = []
+        select_cols = ["spine.DATE AS DATE"]
+        joins = []
+        for i, (table_info, columns, since) in enumerate(requests):
+            date_col = table_info["date_col"]
+            where = Where().date_range(date_col, since)
+            ctes.append(f"""t{i} AS (
+                SELECT CAST({date_col} AS DATE) AS DATE, {self._select_list(table_info, columns)}
+                FROM {table_info['table_name']}
+                {where}
+                {self._group_by(table_info)})""")
+            params += where.params
+            select_cols.append(f"t{i}.DATE AS T{i}__DATE")
+            select_cols += [f"t{i}.{col} AS T{i}__{col}" for col in columns]
+            joins.append(f"LEFT JOIN t{i} ON t{i}.DATE = spine.DATE")
+
+        spine = " UNION ".join(f"SELECT DATE FROM t{i}" for i in range(len(requests)))
+        query = sql(f"""
+            WITH {", ".join(ctes)},
+            spine AS ({spine})
+            SELECT {", ".join(select_cols)}
+            FROM spine
+            {" ".join(joins)}
+            ORDER BY DATE
+        """, *params)
+        wide = self._stream(
+            query,
+            [col.split(" AS ")[-1] for col in select_cols],
+            ", ".join(table_info["table_name"] for table_info, _, _ in requests)
+        )
+        wide["DATE"] = pd.to_datetime(wide["DATE"])
+        wide = wide.set_index("DATE")
+
+        for i, (table_info, columns, _) in enumerate(requests):
+            present = wide[f"T{i}__DATE"].notna()
+            part = wide.loc[present, [f"T{i}__{col}" for col in columns]]
+            result[self._key(table_info)] = part.set_axis(columns, axis=1)
+        return result
+
+    def _refresh(self, table_info, frame):
+        """Re-fetch the last cached day (it may have been partial) and anything newer."""
+        if frame.empty:
+            # Nothing cached to extend: check the whole table again
+            frame = self._fetch(table_info, list(frame.columns))
+            self._store(self._key(table_info), frame)
+            return frame
+        last_date = frame.index[-1]
+        delta = self._fetch(table_info, list(frame.columns), since=last_date)
+        keep = frame.iloc[:frame.index.searchsorted(last_date, side="left")]
+        frame = pd.concat([keep, delta])
+        self._store(self._key(table_info), frame)
+        return frame
+
+    def _is_stale(self, name):
+        with self._lock:
+            checked_at = self._checked_at.get(name, 0)
+        return time.time() - checked_at > self.refresh_interval
+
+    ######################################
+    # Parquet persistence
+    ######################################
+    def _path(self, name):
+        safe_name = re.sub(r"[^A-Za-z0-9_.]", "_", name.upper())
+        return os.path.join(self.cache_dir, f"{safe_name}.parquet")
+
+    def _read(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        with self._lock:
+            self._checked_at[name] = os.path.getmtime(path)
+        return pd.read_parquet(path)
+
+    def _store(self, name, frame):
+        with self._lock:
+            self._frames[name] = frame
+        self._write(name, frame)
+
+    def _write(self, name, frame):
+        # Write to a temp file first so a concurrent reader never sees a partial file.
+        path = self._path(name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        frame.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._checked_at[name] = time.time()
+
+
+@st.cache_resource
+def get_metric_store(_session):
+    """Process-wide MetricStore shared by every page and every user session."""
+    return MetricStore(_session)
@@ -0,0 +1,238 @@
+"""
+Aggregate statistics of the BTC price movement series.
+
+The Movement Thresholding page only needs a histogram, the first four
+moments and a few threshold counts, so these are computed where the data
+lives: in the warehouse (WIDTH_BUCKET bin counts, central moment sums,
+COUNT_IF) or on the locally cached series, with identical outputs. The
+payload of the warehouse mode does not grow with the history length.
+
+The five price movement states (significant / moderate decrease, unchanged,
+moderate / significant increase) are likewise derived locally from the
+cached period-average price for any pair of thresholds.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+from scipy.stats import chi2
+
+from utils.btc_price import get_ohlc_pyramid
+from utils.metric_store import REFRESH_INTERVAL_SECONDS
+from utils.query import Where, run, sql
+from utils.range_cache import slice_dates
+
+MOVEMENT_TABLE = "BTC_PRICE_MOVEMENT_PERCENTAGE"
+MOVEMENT_COL = "PRICE_MOVEMENT_PERCENT"
+
+# Keys of a moments dict: count, mean, central moment sums, range
+MOMENT_KEYS = ("N", "MEAN", "M2", "M3", "M4", "LOW", "HIGH")
+
+# PRICE_MOVEMENT_STATE -> label
+MOVEMENT_STATES = {
+    -2: "Decrease significantly",
+    -1: "Moderate decrease",
+    0: "Unchanged",
+    1: "Moderate increase",
+    2: "Increase significantly",
+}
+
+
+def movement_sql(start_date=None, end_date=None):
+    """Query of the movement rows (DATE, AVG_PRICE, PREV_AVG, PRICE_MOVEMENT_PERCENT) in [start_date, end_date]."""
+    where = Where("PREV_AVG IS NOT NULL").date_range("DATE", start_date, end_date)
+    return sql(f"""
+    SELECT
+        DATE,
+        AVG_PRICE,
+        PREV_AVG,
+        (AVG_PRICE - PREV_AVG)/NULLIF(PREV_AVG, 0) * 100 AS {MOVEMENT_COL}
+    FROM {MOVEMENT_TABLE}
+    {where}
+    """, *where.params)
+
+
+def _values_sql(start_date):
+    movement = movement_sql(start_date)
+    return sql(f"""
+    SELECT {MOVEMENT_COL} AS X
+    FROM ({movement.text})
+    WHERE {MOVEMENT_COL} IS NOT NULL
+    """, *movement.params)
+
+
+######################################
+# Local computation
+######################################
+def moments(values):
+    """Moments dict (see MOMENT_KEYS) of a 1-D array; NaNs are ignored."""
+    x = np.asarray(values, dtype=float)
+    x = x[np.isfinite(x)]
+    if len(x) == 0:
+        return {**dict.fromkeys(MOMENT_KEYS, np.nan), "N": 0}
+    d = x - x.mean()
+    d2 = d * d
+    return {
+        "N": len(x),
+        "MEAN": float(x.mean()),
+        "M2": float(d2.sum()),
+        "M3": float((d2 * d).sum()),
+        "M4": float((d2 * d2).sum()),
+        "LOW": float(x.min()),
+        "HIGH": float(x.max()),
+    }
+
+
+def sorted_values(values):
+    """Finite values of a 1-D array, sorted ascending (the input of histogram / threshold_counts)."""
+    x = np.asarray(values, dtype=float)
+    return np.sort(x[np.isfinite(x)])
+
+
+def histogram(sorted_x, low, high, nbins):
+    """
+    Bin counts with WIDTH_BUCKET semantics on [low, high] (the maximum
+    falls in the last bin), from values sorted ascending: one searchsorted
+    over the bin edges. Returns a DataFrame with BIN (1-based), LOW, HIGH
+    and COUNT, one row per bin.
+    """
+    width = (high - low) / nbins if high > low else 1.0
+    edges = np.searchsorted(sorted_x, low + np.arange(1, nbins) * width, side="left")
+    edges = np.concatenate([[0], edges, [len(sorted_x)]])
+    counts = np.diff(edges)
+    return _bins_frame(pd.Series(counts, index=np.arange(1, nbins + 1)), low, high, nbins)
+
+
+def threshold_counts(sorted_x, thresholds):
+    """{threshold: (values above it, values below it)} from values sorted ascending, O(log n) each."""
+    n = len(sorted_x)
+    return {
+        t: (int(n - np.searchsorted(sorted_x, t, side="right")), int(np.searchsorted(sorted_x, t, side="left")))
+        for t in thresholds
+    }
+
+
+def _bins_frame(counts, low, high, nbins):
+    width = (high - low) / nbins if high > low else 1.0
+    bins = np.arange(1, nbins + 1)
+    return pd.DataFrame({
+        "BIN": bins,
+        "LOW": low + (bins - 1) * width,
+        "HIGH": low + bins * width,
+        "COUNT": counts.reindex(bins, fill_value=0).to_numpy(dtype=int),
+    })
+
+
+def normality(m):
+    """
+    Sample std, skewness, excess kurtosis and the Jarque-Bera test
+    (statistic, p-value) from a moments dict.
+    """
+    n = m["N"]
+    if n < 2 or not m["M2"] > 0:
+        return {"std": np.nan, "skew": np.nan, "kurtosis": np.nan, "jb": np.nan, "p_value": np.nan}
+    var = m["M2"] / n
+    skew = (m["M3"] / n) / var ** 1.5
+    kurtosis = (m["M4"] / n) / var ** 2 - 3.0
+    jb = n / 6.0 * (skew ** 2 + kurtosis ** 2 / 4.0)
+    return {
+        "std": float(np.sqrt(m["M2"] / (n - 1))),
+        "skew": float(skew),
+        "kurtosis": float(kurtosis),
+        "jb": float(jb),
+        "p_value": float(chi2.sf(jb, 2)),
+    }
+
+
+######################################
+# Warehouse computation
+######################################
+@st.cache_data(ttl=REFRESH_INTERVAL_SECONDS)
+def fetch_moments(_session, start_date):
+    """Moments dict of the movement series from `start_date` on, computed in the warehouse."""
+    values = _values_sql(start_date)
+    query = sql(f"""
+    WITH V AS ({values.text}),
+    S AS (SELECT COUNT(X) AS N, AVG(X) AS MEAN, MIN(X) AS LOW, MAX(X) AS HIGH FROM V)
+    SELECT
+        S.N, S.MEAN, S.LOW, S.HIGH,
+        SUM(POWER(V.X - S.MEAN, 2)) AS M2,
+        SUM(POWER(V.X - S.MEAN, 3)) AS M3,
+        SUM(POWER(V.X - S.MEAN, 4)) AS M4
+    FROM V CROSS JOIN S
+    GROUP BY S.N, S.MEAN, S.LOW, S.HIGH
+    """, *values.params)
+    df = run(_session, query)
+    if df.empty:
+        return moments([])
+    row = df.iloc[0]
+    return {key: (int(row[key]) if key == "N" else float(row[key])) for key in MOMENT_KEYS}
+
+
+@st.cache_data(ttl=REFRESH_INTERVAL_SECONDS)
+def fetch_histogram(_session, start_date, low, high, nbins):
+    """histogram() of the movement series from `start_date` on, binned in the warehouse."""
+    nbins = int(nbins)
+    values = _values_sql(start_date)
+    query = sql(f"""
+    SELECT
+        GREATEST(LEAST(WIDTH_BUCKET(X, ?, ?, ?), ?), 1) AS BIN,
+        COUNT(*) AS N_ROWS
+    FROM ({values.text})
+    GROUP BY BIN
+    """, float(low), float(high), nbins, nbins, *values.params)
+    df = run(_session, query)
+    return _bins_frame(df.set_index("BIN")["N_ROWS"], low, high, nbins)
+
+
+@st.cache_data(ttl=REFRESH_INTERVAL_SECONDS)
+def fetch_threshold_counts(_session, start_date, thresholds):
+    """{threshold: (rows above it, rows below it)} counted in the warehouse."""
+    columns = ",\n        ".join(
+        f"COUNT_IF(X > ?) AS ABOVE_{i}, COUNT_IF(X < ?) AS BELOW_{i}"
+        for i in range(len(thresholds))
+    )
+    params = [float(t) for t in thresholds for _ in range(2)]
+    values = _values_sql(start_date)
+    query = sql(f"""
+    SELECT
+        {columns}
+    FROM ({values.text})
+    """, *params, *values.params)
+    row = run(_session, query).iloc[0]
+    return {t: (int(row[f"ABOVE_{i}"]), int(row[f"BELOW_{i}"])) for i, t in enumerate(thresholds)}
+
+
+######################################
+# Movement states
+######################################
+def movement_states(avg_price, threshold, significant_threshold):
+    """
+    PRICE_MOVEMENT_STATE (-2..2, see MOVEMENT_STATES) of each period from
+    the percent change of its average price: unchanged within ±threshold,
+    significant beyond ±significant_threshold, moderate in between. The
+    first period (no previous average) is NaN.
+    """
+    pct = avg_price.pct_change() * 100
+    significant_threshold = max(significant_threshold, threshold)
+    states = np.select(
+        [pct > significant_threshold, pct > threshold, pct < -significant_threshold, pct < -threshold],
+        [2, 1, -2, -1],
+        default=0
+    )
+    return pd.Series(states, index=avg_price.index).where(pct.notna())
+
+
+def load_movement_states(session, span, threshold, significant_threshold, start_date=None, end_date=None):
+    """
+    PERIOD, AVG_PRICE, PRICE_MOVEMENT_PERCENT and PRICE_MOVEMENT_STATE for
+    the Daily or Weekly periods starting in [start_date, end_date]. States
+    are computed over the full cached history, so the first period in range
+    is compared with the one before it.
+    """
+    avg_price = get_ohlc_pyramid(session)[span]["AVG"]
+    frame = pd.DataFrame({
+        "AVG_PRICE": avg_price,
+        "PRICE_MOVEMENT_PERCENT": avg_price.pct_change() * 100,
+        "PRICE_MOVEMENT_STATE": movement_states(avg_price, threshold, significant_threshold),
+    })
+    return slice_dates(frame, start_date, end_date).reset_index()
@@ -0,0 +1,63 @@
+"""
+Column normalization, optionally restarted at every change point.
+
+Rows are labelled with a segment id once (from the change points), and each
+normalization method is applied to all of its columns in one groupby
+transform over that id, instead of one loc-assignment per segment and column.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _scaled(values, center, scale):
+    """(values - center) / scale, leaving groups with a zero scale unchanged."""
+    return ((values - center) / scale).where(scale != 0, values)
+
+
+def _normalize_block(values, segment_ids, method):
+    if method == "Log Transform":
+        # Add small constant to avoid log(0)
+        return np.log(values + 1e-9).replace(-np.inf, np.nan)
+
+    groups = values.groupby(segment_ids)
+    if method == "Z-Score":
+        return _scaled(values, groups.transform("mean"), groups.transform("std"))
+    if method == "Min-Max":
+        low = groups.transform("min")
+        return _scaled(values, low, groups.transform("max") - low)
+    if method == "Robust":
+        iqr = groups.transform("quantile", 0.75) - groups.transform("quantile", 0.25)
+        return _scaled(values, groups.transform("median"), iqr)
+    return values
+
+
+def normalize_per_segment(df: pd.DataFrame, segments: list, columns_to_normalize: dict):
+    """
+    Normalize `df` in place, column by column with the method given in
+    `columns_to_normalize` ("Z-Score", "Min-Max", "Robust", "Log Transform"
+    or "None"), separately within each segment.
+
+    `segments` are ruptures-style end positions (row positions, increasing);
+    rows at or after the last one are left untouched. An empty list
+    normalizes each column over the whole frame.
+    """
+    n = len(df)
+    ends = np.asarray(segments if segments else [n])
+    segment_ids = np.searchsorted(ends, np.arange(n), side="right")
+    rows = np.flatnonzero(segment_ids < len(ends))
+    if len(rows) == 0:
+        return
+
+    by_method = {}
+    for col, method in columns_to_normalize.items():
+        if col in df.columns and method != "None":
+            by_method.setdefault(method, []).append(col)
+
+    for method, cols in by_method.items():
+        for col in cols:
+            if not pd.api.types.is_float_dtype(df[col]):
+                df[col] = df[col].astype(float)
+        col_positions = [df.columns.get_loc(col) for col in cols]
+        values = df.iloc[rows, col_positions]
+        result = _normalize_block(values, segment_ids[rows], method)
+        df.iloc[rows, col_positions] = result.to_numpy()
@@ -0,0 +1,104 @@
+"""
+Range-containment cache for date-filtered warehouse queries.
+
+For each (table, columns) key the cache holds the widest date range fetched
+so far, indexed by a sorted DatetimeIndex. A request for a range inside it is
+answered with a positional slice (no copy, no query); a request that reaches
+outside it only fetches the missing edges and stitches them on.
+"""
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+ONE_DAY = pd.Timedelta(days=1)
+
+# Same cadence as the metric store: the sources change once a day.
+RANGE_CACHE_TTL_SECONDS = 60 * 60
+
+
+def slice_dates(frame, start_date=None, end_date=None):
+    """
+    Slice a frame indexed by a sorted DatetimeIndex to [start_date, end_date]
+    (inclusive, either bound may be None) with two binary searches.
+    """
+    index = frame.index
+    lo = 0 if start_date is None else index.searchsorted(pd.Timestamp(start_date), side="left")
+    hi = len(index) if end_date is None else index.searchsorted(pd.Timestamp(end_date), side="right")
+    return frame.iloc[lo:hi]
+
+
+class _Entry:
+    __slots__ = ("start", "end", "frame", "created_at")
+
+    def __init__(self, start, end, frame):
+        self.start = start  # None = unbounded below
+        self.end = end      # None = up to the latest row
+        self.frame = frame
+        self.created_at = time.time()
+
+
+class RangeCache:
+    """Widest-range-so-far cache keyed by (table, columns)."""
+
+    def __init__(self, ttl=RANGE_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()  # guards the two dicts only, never held during a fetch
+
+    def get(self, table, columns, start_date, end_date, fetch):
+        """
+        Return rows of `table`/`columns` within [start_date, end_date].
+
+        `fetch(start, end)` must return a DataFrame indexed by a sorted
+        DatetimeIndex holding exactly that (inclusive) range; it is only
+        called for the parts not already cached.
+        """
+        key = (table, tuple(columns))
+        start = None if start_date is None else pd.Timestamp(start_date)
+        end = None if end_date is None else pd.Timestamp(end_date)
+
+        # One lock per key: a slow fetch only holds up requests for the same
+        # (table, columns), which would otherwise fetch the same rows twice
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and time.time() - entry.created_at > self.ttl:
+                entry = None
+
+            if entry is None:
+                entry = _Entry(start, end, fetch(start, end))
+            else:
+                pieces = []
+                new_start, new_end = entry.start, entry.end
+                # Missing lower edge
+                if entry.start is not None and (start is None or start < entry.start):
+                    pieces.append(fetch(start, entry.start - ONE_DAY))
+                    new_start = start
+                pieces.append(entry.frame)
+                # Missing upper edge
+                if entry.end is not None and (end is None or end > entry.end):
+                    pieces.append(fetch(entry.end + ONE_DAY, end))
+                    new_end = end
+                if len(pieces) > 1:
+                    merged = _Entry(new_start, new_end, pd.concat(pieces))
+                    merged.created_at = entry.created_at
+                    entry = merged
+            with self._lock:
+                self._entries[key] = entry
+
+        return slice_dates(entry.frame, start, end)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+@st.cache_resource
+def get_range_cache():
+    """Process-wide RangeCache shared by every page and every user session."""
+    return RangeCache()
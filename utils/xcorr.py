@@ -0,0 +1,166 @@
+"""
+All-lags cross-correlation.
+
+For a reference series x and one or more indicator series y, computes the
+correlation of x[t] with y[t - lag] (i.e. pandas `y.shift(lag)`) for every
+requested lag at once. The six pairwise-complete sums a Pearson coefficient
+needs (count, sums, sums of squares, cross product) are all masked
+cross-correlations, so they are obtained for every lag with a handful of
+FFTs instead of one shifted copy of the data per lag. Spearman is Pearson on
+ranks computed once up front.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def _as_columns(values):
+    arr = np.asarray(values, dtype=float)
+    return arr[:, None] if arr.ndim == 1 else arr
+
+
+def _standardize(arr, mask):
+    """Center/scale each column on its valid values (keeps the FFT sums well conditioned)."""
+    counts = mask.sum(axis=0)
+    filled = np.where(mask, arr, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=0) / counts
+        centered = np.where(mask, arr - mean, 0.0)
+        scale = np.sqrt((centered ** 2).sum(axis=0) / counts)
+    scale = np.where((scale > 0) & np.isfinite(scale), scale, 1.0)
+    return centered / scale
+
+
+def _rank(arr, mask):
+    """Average ranks of the valid values of each column (NaN elsewhere)."""
+    ranked = pd.DataFrame(np.where(mask, arr, np.nan)).rank(method="average")
+    return ranked.to_numpy()
+
+
+def lagged_correlation_matrix(x, y, lags, method="pearson", min_periods=2):
+    """
+    Correlation of x[t] with each column of y at y[t - lag].
+
+    Parameters
+    ----------
+    x : 1-D array-like of length n (NaN allowed)
+    y : array-like of shape (n,) or (n, k) (NaN allowed)
+    lags : iterable of ints
+    method : "pearson" or "spearman"
+
+    Returns (corr, counts), both of shape (len(lags), k); correlations with
+    fewer than `min_periods` overlapping pairs are NaN.
+    """
+    x = np.asarray(x, dtype=float)
+    y = _as_columns(y)
+    lags = np.asarray(list(lags), dtype=int)
+    n, k = y.shape
+
+    mx = np.isfinite(x)
+    my = np.isfinite(y)
+    if method == "spearman":
+        x = _rank(x[:, None], mx[:, None])[:, 0]
+        y = _rank(y, my)
+    a = _standardize(x[:, None], mx[:, None])[:, 0]
+    b = _standardize(y, my)
+
+    # r[lag] = sum_t left[t] * right[t - lag], for all lags, via one FFT size
+    nfft = 1 << int(np.ceil(np.log2(max(2 * n - 1, 1))))
+    fa = np.fft.rfft(np.stack([mx.astype(float), a, a * a]), nfft)  # (3, f)
+    fb = np.conj(np.fft.rfft(np.stack([my.astype(float), b, b * b]), nfft, axis=1))  # (3, f, k)
+
+    def xcorr(i, j):
+        return np.fft.irfft(fa[i][:, None] * fb[j], nfft, axis=0)
+
+    in_range = np.abs(lags) < n
+    idx = np.where(lags >= 0, lags, nfft + lags)[in_range]
+
+    count = np.rint(xcorr(0, 0)[idx])
+    sx = xcorr(1, 0)[idx]
+    sy = xcorr(0, 1)[idx]
+    sxx = xcorr(2, 0)[idx]
+    syy = xcorr(0, 2)[idx]
+    sxy = xcorr(1, 1)[idx]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sy / count
+        vx = sxx - sx * sx / count
+        vy = syy - sy * sy / count
+        corr = cov / np.sqrt(vx * vy)
+    # FFT round-off leaves ~1e-12 residue where a window is constant
+    degenerate = (count < min_periods) | (vx <= 1e-9 * count) | (vy <= 1e-9 * count)
+    corr = np.clip(np.where(degenerate, np.nan, corr), -1.0, 1.0)
+
+    corr_out = np.full((len(lags), k), np.nan)
+    count_out = np.zeros((len(lags), k), dtype=int)
+    corr_out[in_range] = corr
+    count_out[in_range] = count.astype(int)
+    return corr_out, count_out
+
+
+def lagged_correlation(x, y, lags, method="pearson", min_periods=2):
+    """
+    Lag curve of one indicator against a reference series.
+
+    Returns a DataFrame with columns Lag, Correlation and N (overlapping
+    sample count at that lag).
+    """
+    lags = list(lags)
+    corr, counts = lagged_correlation_matrix(x, y, lags, method=method, min_periods=min_periods)
+    return pd.DataFrame({"Lag": lags, "Correlation": corr[:, 0], "N": counts[:, 0]})
+
+
+def correlation_cube(reference, features, lags, method="pearson", min_periods=2, workers=None):
+    """
+    Feature x lag correlation cube against one reference series.
+
+    `reference` is a Series and `features` a DataFrame on the same (daily,
+    gap-free) index, so a lag of one row is a lag of one day. All features
+    go through one vectorized call; with `workers` > 1 the feature columns
+    are split across a process pool instead.
+
+    Returns (corr, counts): DataFrames indexed by lag, one column per feature.
+    """
+    lags = list(lags)
+    x = reference.to_numpy(dtype=float)
+    y = features.to_numpy(dtype=float)
+
+    if workers and workers > 1 and y.shape[1] > 1:
+        chunks = [c for c in np.array_split(np.arange(y.shape[1]), workers) if len(c)]
+        with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+            futures = [
+                pool.submit(lagged_correlation_matrix, x, y[:, c], lags, method, min_periods)
+                for c in chunks
+            ]
+            results = [f.result() for f in futures]
+        corr = np.hstack([r[0] for r in results])
+        counts = np.hstack([r[1] for r in results])
+    else:
+        corr, counts = lagged_correlation_matrix(x, y, lags, method=method, min_periods=min_periods)
+
+    index = pd.Index(lags, name="Lag")
+    return (
+        pd.DataFrame(corr, index=index, columns=features.columns),
+        pd.DataFrame(counts, index=index, columns=features.columns),
+    )
+
+
+def rank_best_lags(corr, counts):
+    """
+    One row per feature with the lag of highest absolute correlation,
+    sorted strongest first. Features with no valid lag are dropped.
+    """
+    valid = corr.notna().any(axis=0)
+    corr = corr.loc[:, valid]
+    best_pos = np.nanargmax(np.abs(corr.to_numpy()), axis=0)
+    columns = np.arange(corr.shape[1])
+    best_corr = corr.to_numpy()[best_pos, columns]
+    ranking = pd.DataFrame({
+        "Feature": corr.columns,
+        "Best Lag": corr.index.to_numpy()[best_pos],
+        "Correlation": best_corr,
+        "Abs Correlation": np.abs(best_corr),
+        "N": counts.loc[:, valid].to_numpy()[best_pos, columns],
+    })
+    return ranking.sort_values("Abs Correlation", ascending=False).reset_index(drop=True)